@@ -37,7 +37,8 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'movies',
+    'django.contrib.postgres',
+    'movies.apps.MoviesConfig',
 ]
 
 if env('MOVIE_STAGE') == 'dev':
@@ -92,6 +93,45 @@ DATABASES = {
 }
 
 
+# Movies API
+# время жизни закешированного точного COUNT(*) списка фильмов, секунды
+
+MOVIES_API_COUNT_CACHE_TTL = env.int('MOVIES_API_COUNT_CACHE_TTL', default=300)
+
+# способ сборки документа фильма:
+# documents - готовый JSON из content.movie_documents,
+# sql - JSON собирается в PostgreSQL, orm - ArrayAgg + prefetch_related
+MOVIES_API_SERIALIZER = env.str('MOVIES_API_SERIALIZER', default='documents')
+
+# кодировщик JSON ответов: auto (orjson, если установлен), orjson, stdlib
+MOVIES_API_JSON_BACKEND = env.str('MOVIES_API_JSON_BACKEND', default='auto')
+
+# отдавать документы из PostgreSQL готовыми фрагментами, без json.loads
+# (форматирование пробелов и \u-экранирование будет как у PostgreSQL)
+MOVIES_API_JSON_FRAGMENTS = env.bool(
+    'MOVIES_API_JSON_FRAGMENTS', default=False
+)
+
+# кеш ответов /api/v1/movies/<pk>/, сбрасывается сигналами при изменениях
+MOVIES_API_CACHE = 'movies_api'
+MOVIES_API_DETAIL_CACHE_TTL = env.int(
+    'MOVIES_API_DETAIL_CACHE_TTL', default=24 * 60 * 60
+)
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# бэкенд задаётся URL: locmemcache://, filecache:///var/tmp/movies,
+# rediscache://redis:6379/1 (нужен django-redis)
+
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default='locmemcache://'),
+    'movies_api': env.cache_url(
+        'MOVIES_API_CACHE_URL', default='locmemcache://movies-api'
+    ),
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -1,4 +1,10 @@
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.forms.models import BaseInlineFormSet, ModelChoiceField
+from movies.pagination import AdminPaginator
+from movies.search import movie_search_query, trigram_search
 from .models import (
     Movie, Genre, MovieType, Person,
     PersonRole, MoviePersonRole, Certificate,
@@ -6,20 +12,175 @@ from .models import (
 )
 
 
-class MoviePersonRoleInline(admin.TabularInline):
+class LargeTableAdminMixin:
+    """Список для таблиц на миллионы строк: оценка количества вместо
+    COUNT(*) без фильтров, keyset-навигация по глубоким страницам
+    (см. AdminPaginator) и без второго COUNT(*) для «всего N»."""
+    paginator = AdminPaginator
+    show_full_result_count = False
+
+    # с какого количества строк (по статистике) COUNT(*) не выполняется
+    estimate_threshold = 100000
+    # с какой страницы выборка идёт по ключу, а не по OFFSET
+    keyset_page = 50
+
+    def get_paginator(self, request, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True):
+        return self.paginator(
+            queryset, per_page, orphans, allow_empty_first_page,
+            estimate_threshold=self.estimate_threshold,
+            keyset_page=self.keyset_page,
+        )
+
+
+class PageAutocompleteSelect(AutocompleteSelect):
+    """Автодополнение в строке инлайна: выбранное значение берётся
+    из объекта строки (selected), загруженного select_related вместе
+    со страницей, а не отдельным запросом на каждую строку."""
+    selected = None
+
+    def optgroups(self, name, value, attr=None):
+        selected = self.selected
+        if selected is None or [v for v in value if v] != [str(selected.pk)]:
+            # новая строка или значение из отправленной формы
+            return super().optgroups(name, value, attr)
+
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        options.append(self.create_option(
+            name, selected.pk,
+            self.choices.field.label_from_instance(selected),
+            True, len(options),
+        ))
+
+        return [(None, options, 0)]
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """Формсет инлайна со страницей связанных строк вместо всех;
+    номер страницы - GET-параметр <prefix>-page."""
+    per_page = 50
+    # GET-параметры запроса: номер страницы и остальные параметры
+    # (страницы других инлайнов, _changelist_filters) для ссылок
+    params = None
+    # внешние ключи строк, загружаемые одним JOIN со страницей
+    select_related = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # варианты обычных <select> по полям, общие для всех строк
+        self._choices = {}
+
+    @property
+    def page_param(self):
+        return '{}-page'.format(self.prefix)
+
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            queryset = super().get_queryset().select_related(
+                *self.select_related
+            )
+            number = self.params.get(self.page_param) if self.params else None
+            self.page = Paginator(queryset, self.per_page).get_page(number)
+            self._queryset = self.page.object_list
+
+        return self._queryset
+
+    def _construct_form(self, i, **kwargs):
+        return self._use_loaded_related(super()._construct_form(i, **kwargs))
+
+    @property
+    def empty_form(self):
+        return self._use_loaded_related(super().empty_form)
+
+    def _use_loaded_related(self, form):
+        """Поля select_related выводятся без запросов на каждую строку."""
+        for name in self.select_related:
+            # внешний ключ на объект страницы - скрытое поле, не выбор
+            field = form.fields.get(name)
+            if not isinstance(field, ModelChoiceField):
+                continue
+            # RelatedFieldWidgetWrapper админки
+            widget = getattr(field.widget, 'widget', field.widget)
+            if isinstance(widget, PageAutocompleteSelect):
+                if form.instance.pk is not None:
+                    widget.selected = getattr(form.instance, name)
+            else:
+                # варианты обычного <select> читаются один раз на формсет
+                if name not in self._choices:
+                    self._choices[name] = list(iter(field.choices))
+                field.choices = self._choices[name]
+
+        return form
+
+    def page_url(self, number):
+        """Текущий запрос с заменённым номером страницы этого инлайна."""
+        params = self.params.copy()
+        params[self.page_param] = number
+        return '?' + params.urlencode()
+
+    @property
+    def previous_page_url(self):
+        return self.page_url(self.page.previous_page_number())
+
+    @property
+    def next_page_url(self):
+        return self.page_url(self.page.next_page_number())
+
+
+class PaginatedTabularInline(admin.TabularInline):
+    """Табличный инлайн для фильмов с сотнями связей: строки выводятся
+    страницами по per_page."""
+    formset = PaginatedInlineFormSet
+    template = 'admin/movies/edit_inline/tabular_paginated.html'
+    per_page = 50
+    # внешние ключи, которые выводятся в строках: без select_related
+    # каждое поле стоило бы запроса на строку страницы
+    select_related = ()
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if 'widget' not in kwargs and \
+                db_field.name in self.get_autocomplete_fields(request):
+            kwargs['widget'] = PageAutocompleteSelect(
+                db_field.remote_field, self.admin_site,
+                using=kwargs.get('using'),
+            )
+
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.per_page = self.per_page
+        formset.params = request.GET
+        formset.select_related = self.select_related
+
+        return formset
+
+
+# поля связей выбираются через AJAX-автодополнение: обычный <select>
+# выводил бы все строки persons/movies в каждой строке инлайна
+class MoviePersonRoleInline(PaginatedTabularInline):
     model = MoviePersonRole
     extra = 0
+    autocomplete_fields = ('movie', 'person')
+    select_related = ('movie', 'person', 'person_role')
 
 
-class MovieGenreInline(admin.TabularInline):
+class MovieGenreInline(PaginatedTabularInline):
     model = MovieGenre
+    autocomplete_fields = ('movie', 'genre')
+    select_related = ('movie', 'genre')
 
 
 @admin.register(Movie)
-class MovieAdmin(admin.ModelAdmin):
+class MovieAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     # отображение полей в списке
     list_display = ('title', 'type', 'created', 'rating')
 
+    # type выбирается JOIN-ом, а не запросом на каждую строку
+    list_select_related = ('type',)
+
     # фильтрация в списке
     list_filter = ('type',)
 
@@ -34,10 +195,29 @@ class MovieAdmin(admin.ModelAdmin):
 
     inlines = (MovieGenreInline, MoviePersonRoleInline)
 
+    def get_search_results(self, request, queryset, search_term):
+        # вместо ILIKE '%q%' по description - GIN-индекс search_vector
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+
+        # автодополнение получает недописанные слова, их полнотекстовый
+        # поиск не находит - ищем по триграммному индексу названия
+        if request.path.endswith('/autocomplete/'):
+            return trigram_search(queryset, 'title', search_term), False
+
+        condition = Q(search_vector=movie_search_query(search_term))
+        if search_term.isdigit():
+            condition |= Q(pk=int(search_term))
+
+        return queryset.filter(condition), False
+
 
 @admin.register(Genre)
-class GenreAdmin(admin.ModelAdmin):
-    pass
+class GenreAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    # нужно для автодополнения в MovieGenreInline; жанров немного,
+    # ILIKE по ним дешёвый
+    search_fields = ('name',)
 
 
 @admin.register(MovieType)
@@ -46,9 +226,20 @@ class MovieTypeAdmin(admin.ModelAdmin):
 
 
 @admin.register(Person)
-class PersonAdmin(admin.ModelAdmin):
+class PersonAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    # поиск по триграммному индексу, см. get_search_results
+    search_fields = ('full_name',)
+
     inlines = (MoviePersonRoleInline, )
 
+    def get_search_results(self, request, queryset, search_term):
+        # нечёткий поиск: опечатки, регистр и ё/е не важны
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+
+        return trigram_search(queryset, 'full_name', search_term), False
+
 
 @admin.register(PersonRole)
 class PersonRoleAdmin(admin.ModelAdmin):
@@ -0,0 +1,119 @@
+from django.db.models import Exists, OuterRef
+from django.utils.dateparse import parse_date
+from movies.models import MovieGenre, MoviePersonRole
+from movies.pagination import InvalidQueryParam
+from movies.search import movie_search_query
+
+# ?sort= -> поле модели; к сортировке всегда добавляется id,
+# чтобы порядок был однозначным (и подходил для keyset-курсора)
+SORT_FIELDS = {
+    'rating': 'rating',
+    'creation_date': 'creation_date',
+    'title': 'title',
+}
+
+
+def _int_param(params, name):
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidQueryParam('{} must be an integer'.format(name))
+
+
+def _float_param(params, name):
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise InvalidQueryParam('{} must be a number'.format(name))
+
+
+def _date_param(params, name):
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        date = parse_date(value)
+    except ValueError:
+        date = None
+    if date is None:
+        raise InvalidQueryParam('{} must be a date (YYYY-MM-DD)'.format(name))
+    return date
+
+
+def filter_movies(queryset, params):
+    """Фильтры списка фильмов:
+    ?q=<текст>&genre=<id>&type=<id>&certificate=<id>&person=<id>
+    &rating_min=&rating_max=&creation_date_from=&creation_date_to=
+
+    Жанр и персона проверяются через EXISTS, а не JOIN: так строки фильма
+    не размножаются и индексы (genre_id, movie_id) / (person_id, movie_id)
+    используются для полусоединения.
+    """
+    # полнотекстовый поиск по GIN-индексу movies.search_vector
+    q = params.get('q')
+    if q:
+        queryset = queryset.filter(search_vector=movie_search_query(q))
+
+    genre = _int_param(params, 'genre')
+    if genre is not None:
+        queryset = queryset.filter(Exists(
+            MovieGenre.objects.filter(movie=OuterRef('pk'), genre_id=genre)
+        ))
+
+    person = _int_param(params, 'person')
+    if person is not None:
+        queryset = queryset.filter(Exists(
+            MoviePersonRole.objects.filter(
+                movie=OuterRef('pk'), person_id=person
+            )
+        ))
+
+    movie_type = _int_param(params, 'type')
+    if movie_type is not None:
+        queryset = queryset.filter(type_id=movie_type)
+
+    certificate = _int_param(params, 'certificate')
+    if certificate is not None:
+        queryset = queryset.filter(certificate_id=certificate)
+
+    rating_min = _float_param(params, 'rating_min')
+    if rating_min is not None:
+        queryset = queryset.filter(rating__gte=rating_min)
+
+    rating_max = _float_param(params, 'rating_max')
+    if rating_max is not None:
+        queryset = queryset.filter(rating__lte=rating_max)
+
+    date_from = _date_param(params, 'creation_date_from')
+    if date_from is not None:
+        queryset = queryset.filter(creation_date__gte=date_from)
+
+    date_to = _date_param(params, 'creation_date_to')
+    if date_to is not None:
+        queryset = queryset.filter(creation_date__lte=date_to)
+
+    return queryset
+
+
+def get_ordering(params, default=None):
+    """?sort=rating|-rating|creation_date|-creation_date|title|-title"""
+    sort = params.get('sort')
+    if not sort:
+        return default
+
+    field = SORT_FIELDS.get(sort.lstrip('-'))
+    if field is None:
+        raise InvalidQueryParam(
+            'sort must be one of: {}'.format(', '.join(SORT_FIELDS))
+        )
+
+    if sort.startswith('-'):
+        return ('-' + field, '-id')
+
+    return (field, 'id')
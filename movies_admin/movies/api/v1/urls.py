@@ -4,5 +4,8 @@ from movies.api.v1 import views
 
 urlpatterns = [
     path('movies/', views.Movies.as_view()),
+    path('movies/export/', views.MoviesExport.as_view()),
+    path('movies/autocomplete/', views.MoviesAutocompleteApi.as_view()),
     path('movies/<int:pk>/', views.MoviesDetailApi.as_view()),
+    path('persons/', views.PersonsLookupApi.as_view()),
 ]
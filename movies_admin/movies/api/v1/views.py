@@ -1,32 +1,108 @@
+import hashlib
+import math
+
+from django.conf import settings
 from django.contrib.postgres.aggregates import ArrayAgg
-from django.db.models import Q
-from django.http import JsonResponse
+from django.contrib.postgres.search import SearchRank
+from django.db.models import F, Q
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.views.generic import View
 from django.views.generic.dates import BaseDetailView
 from django.views.generic.list import BaseListView
-from movies.models import Movie
+from movies.api.v1.filters import filter_movies, get_ordering
+from movies.cache import movie_response_cache
+from movies.documents import (
+    PERSON_ROLES,
+    iter_ndjson_chunks,
+    load_movie_document,
+    movie_document,
+    stored_movie_document,
+)
+from movies.encoders import RawJSON, get_json_backend
+from movies.models import CatalogVersion, Movie, Person
+from movies.search import movie_search_query, trigram_search
+from movies.pagination import (
+    CachedCountPaginator,
+    CursorPaginator,
+    InvalidQueryParam,
+    estimate_count,
+    paginate_without_count,
+)
 
 
 class MoviesApiMixin:
     model = Movie
     http_method_names = ['get']
 
+    def get(self, request, *args, **kwargs):
+        try:
+            return super().get(request, *args, **kwargs)
+        except InvalidQueryParam as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+    def get_base_queryset(self):
+        return Movie.objects.all()
+
+    def get_ordering(self):
+        return None
+
+    def annotate_queryset(self, queryset):
+        return queryset
+
+    def get_serializer_engine(self):
+        return settings.MOVIES_API_SERIALIZER
+
     def get_queryset(self):
-        return Movie.objects.select_related(
-            'type'
-        ).prefetch_related(
-            'genres', 'persons'
-        ).annotate(
-            actors=ArrayAgg('persons__full_name', filter=Q(person_roles__name='актёр'))
-        ).annotate(
-            directors=ArrayAgg('persons__full_name', filter=Q(person_roles__name='режисёр'))
-        ).annotate(
-            writers=ArrayAgg('persons__full_name', filter=Q(person_roles__name='сценарист'))
-        )
+        engine = self.get_serializer_engine()
+
+        # 'documents': готовый документ из content.movie_documents
+        if engine == 'documents':
+            queryset = self.get_base_queryset().annotate(
+                document=stored_movie_document()
+            )
+
+        # 'sql': документ собирается в PostgreSQL одним запросом на страницу
+        elif engine == 'sql':
+            queryset = self.get_base_queryset().annotate(
+                document=movie_document()
+            )
+
+        else:
+            queryset = self.get_base_queryset().select_related(
+                'type'
+            ).prefetch_related(
+                'genres'
+            ).annotate(**{
+                field: ArrayAgg(
+                    'persons__full_name',
+                    filter=Q(person_roles__name=role)
+                ) for field, role in PERSON_ROLES
+            })
+
+        queryset = self.annotate_queryset(queryset)
+
+        ordering = self.get_ordering()
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+
+        return queryset
 
     def render_to_response(self, context):
-        return JsonResponse(context)
+        return HttpResponse(
+            get_json_backend(settings.MOVIES_API_JSON_BACKEND).dumps(context),
+            content_type='application/json',
+        )
 
     def movie_serialize(self, movie):
+        if self.get_serializer_engine() in ('documents', 'sql'):
+            # документ из PostgreSQL можно отдать без разбора и
+            # повторного кодирования
+            if settings.MOVIES_API_JSON_FRAGMENTS:
+                return RawJSON(movie.document)
+            return load_movie_document(movie.document)
+
         movie_genres = []
         for genre in movie.genres.all():
             movie_genres.append(genre.name)
@@ -35,7 +111,11 @@ class MoviesApiMixin:
             "id": movie.id,
             "title": movie.title,
             "description": movie.description,
-            "creation_date": movie.creation_date,
+            # строка вместо date: кодировщику не нужен хук default()
+            "creation_date": (
+                movie.creation_date.isoformat()
+                if movie.creation_date else None
+            ),
             "rating": movie.rating,
             "type": movie.type.name,
             "genres": movie_genres,
@@ -45,11 +125,102 @@ class MoviesApiMixin:
         }
 
 
+def catalog_version(request):
+    # версия читается один раз на запрос: её используют и ETag,
+    # и Last-Modified
+    if not hasattr(request, 'catalog_version'):
+        request.catalog_version = CatalogVersion.objects.filter(
+            pk=1
+        ).values_list('version', 'modified').first()
+
+    return request.catalog_version
+
+
+def movies_list_etag(request, *args, **kwargs):
+    version = catalog_version(request)
+    if version:
+        params = sorted(request.GET.lists())
+        return hashlib.md5(repr((version[0], params)).encode()).hexdigest()
+
+
+def movies_list_last_modified(request, *args, **kwargs):
+    version = catalog_version(request)
+    if version:
+        return version[1]
+
+
+@method_decorator(
+    condition(
+        etag_func=movies_list_etag,
+        last_modified_func=movies_list_last_modified,
+    ),
+    name='get'
+)
 class Movies(MoviesApiMixin, BaseListView):
     paginate_by = 50
+    paginator_class = CachedCountPaginator
+    cursor_ordering = ('created', 'id')
+    count_modes = ('exact', 'estimate', 'false')
+
+    def get_base_queryset(self):
+        return filter_movies(Movie.objects.all(), self.request.GET)
+
+    def get_ordering(self):
+        # результаты поиска по умолчанию упорядочены по релевантности
+        default = ('-rank', 'id') if self.request.GET.get('q') else None
+        return get_ordering(self.request.GET, default)
+
+    def annotate_queryset(self, queryset):
+        q = self.request.GET.get('q')
+        if q:
+            queryset = queryset.annotate(
+                rank=SearchRank(F('search_vector'), movie_search_query(q))
+            )
+
+        return queryset
+
+    def get_paginator(self, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True, **kwargs):
+        return self.paginator_class(
+            queryset, per_page, orphans=orphans,
+            allow_empty_first_page=allow_empty_first_page,
+            count_queryset=self.get_base_queryset(),
+            count_timeout=settings.MOVIES_API_COUNT_CACHE_TTL,
+            **kwargs
+        )
+
+    def get_count_mode(self):
+        count_mode = self.request.GET.get('count', 'exact')
+        if count_mode not in self.count_modes:
+            raise InvalidQueryParam(
+                'count must be one of: {}'.format(', '.join(self.count_modes))
+            )
+
+        return count_mode
+
+    def get_page_number(self):
+        try:
+            page_number = int(self.request.GET.get('page', 1))
+        except ValueError:
+            raise InvalidQueryParam('page must be an integer')
+
+        if page_number < 1:
+            raise InvalidQueryParam('page must be greater than 0')
+
+        return page_number
 
     def get_context_data(self, *args, **kwargs):
         queryset = self.get_queryset()
+
+        # ?cursor= включает keyset-пагинацию, ?page= работает как раньше
+        if 'cursor' in self.request.GET:
+            return self.get_cursor_context_data(queryset)
+
+        # ?count=estimate|false избавляет от точного COUNT(*)
+        count_mode = self.get_count_mode()
+        if count_mode != 'exact':
+            return self.get_uncounted_context_data(queryset, count_mode)
+
         paginator, page, queryset, is_paginated = self.paginate_queryset(
             queryset,
             self.paginate_by
@@ -74,7 +245,153 @@ class Movies(MoviesApiMixin, BaseListView):
 
         return context
 
+    def get_uncounted_context_data(self, queryset, count_mode):
+        page_number = self.get_page_number()
+        movies, has_previous, has_next = paginate_without_count(
+            queryset, page_number, self.paginate_by
+        )
 
+        context = {
+            "count": None,
+            "total_pages": None,
+            "prev": page_number - 1 if has_previous else None,
+            "next": page_number + 1 if has_next else None,
+            "results": [self.movie_serialize(movie) for movie in movies],
+        }
+
+        if count_mode == 'estimate':
+            context["count"] = estimate_count(self.get_base_queryset())
+            context["total_pages"] = max(
+                1, math.ceil(context["count"] / self.paginate_by)
+            )
+
+        return context
+
+    def get_cursor_context_data(self, queryset):
+        if self.request.GET.get('q'):
+            raise InvalidQueryParam(
+                'Cursor pagination is not supported together with q'
+            )
+
+        paginator = CursorPaginator(
+            queryset,
+            self.paginate_by,
+            ordering=self.get_ordering() or self.cursor_ordering,
+        )
+        movies, prev_cursor, next_cursor = paginator.page(
+            self.request.GET.get('cursor')
+        )
+
+        return {
+            "prev": prev_cursor,
+            "next": next_cursor,
+            "results": [self.movie_serialize(movie) for movie in movies],
+        }
+
+
+def cached_movie_etag(request, pk):
+    # запись кеша запоминается в request, чтобы get() не ходил в кеш повторно;
+    # поколение читается до запроса к базе, под ним get() запишет ответ
+    request.movie_cache_generation = movie_response_cache.generation(pk)
+    request.movie_cache_entry = movie_response_cache.get(
+        pk, request.movie_cache_generation
+    )
+    if request.movie_cache_entry:
+        return request.movie_cache_entry[0]
+
+
+@method_decorator(condition(etag_func=cached_movie_etag), name='get')
 class MoviesDetailApi(MoviesApiMixin, BaseDetailView):
+    def get(self, request, *args, **kwargs):
+        # попадание в кеш (и 304 в condition) обходится без базы данных
+        entry = getattr(request, 'movie_cache_entry', None)
+        if entry:
+            response = HttpResponse(entry[1], content_type='application/json')
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = movie_response_cache.set(
+                kwargs['pk'], request.movie_cache_generation, response.content
+            )
+        response['X-Cache'] = 'MISS'
+
+        return response
+
     def get_context_data(self, *args, **kwargs):
         return self.movie_serialize(self.object)
+
+
+class MoviesExport(View):
+    """Выгрузка всего каталога в NDJSON, по документу фильма на строку.
+
+    Строки идут по возрастанию id; после обрыва соединения выгрузку можно
+    продолжить с ?after=<id последней полученной строки>.
+    """
+    http_method_names = ['get']
+    chunk_size = 1000
+
+    def get(self, request, *args, **kwargs):
+        after = request.GET.get('after')
+        if after is not None:
+            try:
+                after = int(after)
+            except ValueError:
+                return JsonResponse(
+                    {'error': 'after must be an integer'}, status=400
+                )
+
+        response = StreamingHttpResponse(
+            iter_ndjson_chunks(after, self.chunk_size),
+            content_type='application/x-ndjson',
+        )
+        # nginx не должен буферизовать поток целиком
+        response['X-Accel-Buffering'] = 'no'
+
+        return response
+
+
+class TrigramLookupApi(View):
+    """Нечёткий поиск по GIN-индексу pg_trgm для автодополнения."""
+    http_method_names = ['get']
+    model = None
+    field = None
+    limit = 20
+    max_limit = 50
+
+    def get(self, request, *args, **kwargs):
+        q = request.GET.get('q', '').strip()
+        try:
+            limit = min(int(request.GET.get('limit', self.limit)),
+                        self.max_limit)
+        except ValueError:
+            return JsonResponse({'error': 'limit must be an integer'},
+                                status=400)
+        if limit < 1:
+            return JsonResponse({'error': 'limit must be greater than 0'},
+                                status=400)
+
+        results = []
+        if q:
+            results = list(
+                trigram_search(self.model.objects.all(), self.field, q)
+                .values('id', self.field, 'similarity')[:limit]
+            )
+
+        return HttpResponse(
+            get_json_backend(settings.MOVIES_API_JSON_BACKEND).dumps(
+                {'results': results}
+            ),
+            content_type='application/json',
+        )
+
+
+class PersonsLookupApi(TrigramLookupApi):
+    model = Person
+    field = 'full_name'
+
+
+class MoviesAutocompleteApi(TrigramLookupApi):
+    model = Movie
+    field = 'title'
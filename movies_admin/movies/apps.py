@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class MoviesConfig(AppConfig):
     name = 'movies'
+
+    def ready(self):
+        from movies.signals import connect_signals
+        connect_signals()
@@ -0,0 +1,254 @@
+"""Сессия массовой загрузки: вторичные индексы и внешние ключи таблиц
+снимаются на время загрузки и восстанавливаются после неё.
+
+    with BulkLoadSession(connect, ['content.movies', ...]):
+        ... COPY / INSERT миллионов строк ...
+
+Поддерживать индексы и проверять ссылки на каждой вставленной строке
+дороже, чем построить индекс один раз по готовым данным. При входе
+определения индексов и внешних ключей (pg_get_indexdef,
+pg_get_constraintdef) сохраняются в таблицу bulk_load_session и объекты
+удаляются. При выходе - и после успешной загрузки, и после ошибки -
+индексы строятся заново параллельно на отдельных соединениях
+с увеличенным maintenance_work_mem, внешние ключи добавляются как
+NOT VALID и проверяются VALIDATE CONSTRAINT, таблицы анализируются.
+
+Первичные ключи и уникальные индексы не трогаются: на них опирается
+ON CONFLICT загрузчиков, без них дубликаты попали бы в таблицу
+и уникальный индекс потом не построился бы.
+
+Если процесс упал посреди загрузки, определения остаются в таблице:
+следующая сессия подхватит их и восстановит вместе со своими.
+
+Модуль не зависит от Django: им пользуются и команда fake_data,
+и sqlite_to_postgres/load_data.py. connect - функция без аргументов,
+возвращающая новое соединение psycopg2.
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+INDEX = 'index'
+FOREIGN_KEY = 'foreign key'
+
+# вторичные индексы: не первичный ключ, не уникальные и не под
+# ограничением (EXCLUDE и т. п.); таблица записывается со схемой явно,
+# а не regclass::text, который зависит от search_path соединения
+INDEXES_SQL = """
+SELECT format('%%I.%%I', n.nspname, c.relname),
+       format('%%I.%%I', tn.nspname, t.relname),
+       pg_get_indexdef(i.indexrelid)
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_class t ON t.oid = i.indrelid
+    JOIN pg_namespace tn ON tn.oid = t.relnamespace
+    WHERE i.indrelid = ANY(%s::regclass[])
+      AND NOT i.indisprimary
+      AND NOT i.indisunique
+      AND NOT EXISTS (
+          SELECT 1 FROM pg_constraint WHERE conindid = i.indexrelid
+      )
+    ORDER BY 1
+"""
+
+FOREIGN_KEYS_SQL = """
+SELECT quote_ident(r.conname), format('%%I.%%I', tn.nspname, t.relname),
+       pg_get_constraintdef(r.oid)
+    FROM pg_constraint r
+    JOIN pg_class t ON t.oid = r.conrelid
+    JOIN pg_namespace tn ON tn.oid = t.relnamespace
+    WHERE r.contype = 'f' AND r.conrelid = ANY(%s::regclass[])
+    ORDER BY 1
+"""
+
+
+@dataclass(frozen=True)
+class SavedObject:
+    """Снятый индекс или внешний ключ: имя (уже в кавычках), таблица
+    и определение."""
+    kind: str
+    name: str
+    table: str
+    definition: str
+
+    def drop_sql(self):
+        if self.kind == INDEX:
+            return 'DROP INDEX IF EXISTS {}'.format(self.name)
+        return 'ALTER TABLE {} DROP CONSTRAINT IF EXISTS {}'.format(
+            self.table, self.name
+        )
+
+
+class BulkLoadSession():
+    """Снимает вторичные индексы и внешние ключи tables на время
+    загрузки (см. описание модуля).
+
+    workers - сколько индексов строится одновременно;
+    maintenance_work_mem - память на построение одного индекса.
+    """
+
+    def __init__(self, connect, tables, workers=4,
+                 maintenance_work_mem='512MB', schema='content'):
+        self.connect = connect
+        self.tables = list(tables)
+        self.workers = workers
+        self.maintenance_work_mem = maintenance_work_mem
+        self.store = '{}.bulk_load_session'.format(schema)
+        self.saved = []
+
+    def __enter__(self):
+        self.begin()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # восстанавливаем и после ошибки загрузки; ошибка восстановления
+        # в этом случае не должна заслонить исходную
+        if exc_type is None:
+            self.finish()
+        else:
+            try:
+                self.finish()
+            except Exception as error:
+                print(
+                    'Bulk load session restore failed: %s' % error,
+                    file=sys.stderr,
+                )
+
+        return False
+
+    def _execute(self, statements):
+        conn = self.connect()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                for sql, params in statements:
+                    cursor.execute(sql, params)
+        finally:
+            conn.close()
+
+    def _setup(self, cursor):
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS {} ("
+            "   table_name text NOT NULL,"
+            "   name text NOT NULL,"
+            "   kind text NOT NULL,"
+            "   definition text NOT NULL,"
+            "   created_at timestamp with time zone NOT NULL DEFAULT now(),"
+            "   PRIMARY KEY (table_name, name)"
+            ")".format(self.store)
+        )
+
+    def begin(self):
+        """Сохраняет определения и удаляет объекты одной транзакцией."""
+        conn = self.connect()
+        try:
+            with conn, conn.cursor() as cursor:
+                self._setup(cursor)
+                # остатки упавшей сессии: эти объекты уже удалены
+                cursor.execute(
+                    'SELECT kind, name, table_name, definition FROM {} '
+                    'ORDER BY created_at, name'.format(self.store)
+                )
+                saved = [SavedObject(*row) for row in cursor.fetchall()]
+
+                names = {(item.table, item.name) for item in saved}
+                for kind, sql in (
+                    (INDEX, INDEXES_SQL), (FOREIGN_KEY, FOREIGN_KEYS_SQL)
+                ):
+                    cursor.execute(sql, [self.tables])
+                    for name, table, definition in cursor.fetchall():
+                        if (table, name) in names:
+                            continue
+                        item = SavedObject(kind, name, table, definition)
+                        cursor.execute(
+                            'INSERT INTO {} '
+                            '(name, kind, table_name, definition) '
+                            'VALUES (%s, %s, %s, %s)'.format(self.store),
+                            [item.name, item.kind, item.table,
+                             item.definition]
+                        )
+                        cursor.execute(item.drop_sql())
+                        saved.append(item)
+        finally:
+            conn.close()
+
+        self.saved = saved
+        print('Bulk load session: dropped %s indexes, %s foreign keys' % (
+            sum(item.kind == INDEX for item in saved),
+            sum(item.kind == FOREIGN_KEY for item in saved),
+        ))
+
+    def _create_index(self, item):
+        self._execute([
+            ("SELECT set_config('maintenance_work_mem', %s, false)",
+             [self.maintenance_work_mem]),
+            (item.definition, None),
+            ('DELETE FROM {} WHERE table_name = %s AND name = %s'.format(
+                self.store
+            ), [item.table, item.name]),
+        ])
+
+    def _add_foreign_key(self, item):
+        # NOT VALID берёт короткую блокировку, проверка строк - отдельно
+        # и не блокирует запись в таблицу
+        self._execute([
+            ('ALTER TABLE {} ADD CONSTRAINT {} {} NOT VALID'.format(
+                item.table, item.name, item.definition
+            ), None),
+            ('DELETE FROM {} WHERE table_name = %s AND name = %s'.format(
+                self.store
+            ), [item.table, item.name]),
+        ])
+
+    def _validate_foreign_key(self, item):
+        self._execute([(
+            'ALTER TABLE {} VALIDATE CONSTRAINT {}'.format(
+                item.table, item.name
+            ), None
+        )])
+
+    def _run(self, action, items):
+        """action над items в workers потоках; ошибки собираются,
+        чтобы восстановить всё, что получится."""
+        errors = []
+        with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as pool:
+            futures = [(item, pool.submit(action, item)) for item in items]
+            for item, future in futures:
+                try:
+                    future.result()
+                except Exception as error:
+                    errors.append('{} {}: {}'.format(
+                        item.kind, item.name, error
+                    ))
+
+        return errors
+
+    def finish(self):
+        """Строит индексы, возвращает и проверяет внешние ключи,
+        выполняет ANALYZE."""
+        started = time.monotonic()
+        indexes = [item for item in self.saved if item.kind == INDEX]
+        foreign_keys = [
+            item for item in self.saved if item.kind == FOREIGN_KEY
+        ]
+
+        errors = self._run(self._create_index, indexes)
+        errors += self._run(self._add_foreign_key, foreign_keys)
+        if not errors:
+            errors += self._run(self._validate_foreign_key, foreign_keys)
+        self._execute([
+            ('ANALYZE {}'.format(table), None) for table in self.tables
+        ])
+
+        if errors:
+            raise RuntimeError(
+                'Bulk load session restore failed:\n' + '\n'.join(errors)
+            )
+
+        self.saved = []
+        print('Bulk load session: restored in %.1f s' % (
+            time.monotonic() - started
+        ))
+
@@ -0,0 +1,101 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class MovieResponseCache:
+    """Кеш готовых ответов /api/v1/movies/<pk>/.
+
+    Хранит байты тела ответа и ETag. Бэкенд задаётся через
+    CACHES[settings.MOVIES_API_CACHE] (locmem, файловый, Redis).
+    Ключ записи включает поколение фильма - счётчик, который
+    movies.signals увеличивает при изменении фильма или связанных с ним
+    жанров, персон и типа. Поколение читается до запроса к базе, поэтому
+    ответ, собранный из данных до параллельного изменения, записывается
+    под старым поколением и больше не читается (а не закрепляет старую
+    версию до истечения срока). Старые записи вытесняются по сроку.
+    """
+
+    key_prefix = 'movies:detail:'
+    generation_prefix = 'movies:detail-generation:'
+    hits_key = 'movies:detail-stats:hits'
+    misses_key = 'movies:detail-stats:misses'
+
+    @property
+    def cache(self):
+        return caches[settings.MOVIES_API_CACHE]
+
+    def make_key(self, movie_id, generation):
+        return '{}{}:{}'.format(self.key_prefix, movie_id, generation)
+
+    def make_generation_key(self, movie_id):
+        return '{}{}'.format(self.generation_prefix, movie_id)
+
+    def make_etag(self, body):
+        return '"{}"'.format(hashlib.md5(body).hexdigest())
+
+    def _incr(self, key):
+        self.cache.add(key, 0, None)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # ключ мог быть вытеснен между add и incr
+            self.cache.set(key, 1, None)
+
+    def _start_generation(self, key):
+        # счётчик, которого нет (или который вытеснен), начинается
+        # с текущего времени, а не с нуля: иначе снова стали бы видны
+        # записи, сброшенные до вытеснения
+        self.cache.add(key, time.time_ns(), None)
+
+    def generation(self, movie_id):
+        """Текущее поколение записей фильма."""
+        key = self.make_generation_key(movie_id)
+        generation = self.cache.get(key)
+        if generation is None:
+            self._start_generation(key)
+            generation = self.cache.get(key)
+
+        return generation
+
+    def get(self, movie_id, generation):
+        """Возвращает (etag, body) или None."""
+        entry = self.cache.get(self.make_key(movie_id, generation))
+        self._incr(self.hits_key if entry else self.misses_key)
+
+        return entry
+
+    def set(self, movie_id, generation, body):
+        etag = self.make_etag(body)
+        self.cache.set(
+            self.make_key(movie_id, generation),
+            (etag, body),
+            settings.MOVIES_API_DETAIL_CACHE_TTL
+        )
+
+        return etag
+
+    def invalidate(self, movie_ids):
+        for movie_id in movie_ids:
+            key = self.make_generation_key(movie_id)
+            self._start_generation(key)
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                # ключ мог быть вытеснен между add и incr
+                self._start_generation(key)
+
+    def stats(self):
+        values = self.cache.get_many([self.hits_key, self.misses_key])
+        return {
+            'hits': values.get(self.hits_key, 0),
+            'misses': values.get(self.misses_key, 0),
+        }
+
+    def reset_stats(self):
+        self.cache.delete_many([self.hits_key, self.misses_key])
+
+
+movie_response_cache = MovieResponseCache()
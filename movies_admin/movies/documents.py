@@ -0,0 +1,181 @@
+import json
+
+from django.db import connections
+from django.db.models import F, TextField
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+from movies.models import (
+    Genre,
+    Movie,
+    MovieDocument,
+    MovieGenre,
+    MoviePersonRole,
+    MovieType,
+    Person,
+    PersonRole,
+)
+
+# Поле документа -> название роли в content.person_roles
+PERSON_ROLES = (
+    ('actors', 'актёр'),
+    ('directors', 'режисёр'),
+    ('writers', 'сценарист'),
+)
+
+
+def _table(model):
+    # db_table вида 'content"."movies' превращается в "content"."movies"
+    return '"{}"'.format(model._meta.db_table)
+
+
+def movie_document_sql(movie_alias=None):
+    """SQL-выражение, которое собирает JSON-документ фильма целиком
+    в PostgreSQL.
+
+    Жанры и персоны выбираются коррелированными подзапросами, поэтому
+    нет декартова произведения movie x persons x roles и GROUP BY.
+    Возвращает (sql, params).
+    """
+    movie = movie_alias or _table(Movie)
+
+    persons = []
+    params = []
+    for field, role in PERSON_ROLES:
+        persons.append(
+            "'{field}', COALESCE(("
+            "SELECT json_agg(p.full_name ORDER BY mpr.id) "
+            "FROM {movie_person_role} mpr "
+            "JOIN {persons} p ON p.id = mpr.person_id "
+            "JOIN {person_roles} pr ON pr.id = mpr.person_role_id "
+            "WHERE mpr.movie_id = {movie}.id AND pr.name = %s"
+            "), '[]'::json)".format(
+                field=field,
+                movie=movie,
+                movie_person_role=_table(MoviePersonRole),
+                persons=_table(Person),
+                person_roles=_table(PersonRole),
+            )
+        )
+        params.append(role)
+
+    sql = (
+        "json_build_object("
+        "'id', {movie}.id, "
+        "'title', {movie}.title, "
+        "'description', {movie}.description, "
+        "'creation_date', {movie}.creation_date, "
+        "'rating', {movie}.rating, "
+        "'type', ("
+        "SELECT t.name FROM {movie_types} t WHERE t.id = {movie}.type_id"
+        "), "
+        "'genres', COALESCE(("
+        "SELECT json_agg(g.name ORDER BY mg.id) "
+        "FROM {movie_genre} mg "
+        "JOIN {genres} g ON g.id = mg.genre_id "
+        "WHERE mg.movie_id = {movie}.id"
+        "), '[]'::json), "
+        "{persons}"
+        ")::text"
+    ).format(
+        movie=movie,
+        movie_types=_table(MovieType),
+        movie_genre=_table(MovieGenre),
+        genres=_table(Genre),
+        persons=', '.join(persons),
+    )
+
+    return sql, params
+
+
+def movie_document():
+    """Аннотация queryset фильмов с готовым JSON-документом (текст)."""
+    sql, params = movie_document_sql()
+    return RawSQL(sql, params, output_field=TextField())
+
+
+def stored_movie_document():
+    """Документ из content.movie_documents; если строки там ещё нет,
+    он собирается на лету тем же выражением, что и movie_document()."""
+    return Coalesce(
+        F('movie_document__document'),
+        movie_document(),
+        output_field=TextField(),
+    )
+
+
+def refresh_movie_documents(movie_ids, using='default'):
+    """Пересобирает документы указанных фильмов одним INSERT ... SELECT."""
+    movie_ids = list(set(movie_ids))
+    if not movie_ids:
+        return 0
+
+    sql, params = movie_document_sql(movie_alias='m')
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO {documents} (movie_id, document, modified) "
+            "SELECT m.id, {document}, now() "
+            "FROM {movies} m WHERE m.id = ANY(%s) "
+            "ON CONFLICT (movie_id) DO UPDATE "
+            "SET document = EXCLUDED.document, "
+            "modified = EXCLUDED.modified".format(
+                documents=_table(MovieDocument),
+                document=sql,
+                movies=_table(Movie),
+            ),
+            params + [movie_ids]
+        )
+
+        return cursor.rowcount
+
+
+def delete_orphan_movie_documents(using='default'):
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM {documents} d WHERE NOT EXISTS "
+            "(SELECT 1 FROM {movies} m WHERE m.id = d.movie_id)".format(
+                documents=_table(MovieDocument),
+                movies=_table(Movie),
+            )
+        )
+
+        return cursor.rowcount
+
+
+def iter_movie_documents(after=None, chunk_size=1000):
+    """Все документы каталога в порядке id через серверный (именованный)
+    курсор: в памяти одновременно не больше chunk_size строк.
+
+    after - id последнего уже полученного фильма, для продолжения выгрузки.
+    """
+    queryset = Movie.objects.order_by('pk').annotate(
+        document=stored_movie_document()
+    ).values_list('pk', 'document')
+
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+def iter_ndjson_chunks(after=None, chunk_size=1000):
+    """Документы в формате NDJSON, по chunk_size строк в одном куске."""
+    lines = []
+    for _, document in iter_movie_documents(after, chunk_size):
+        lines.append(document)
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def load_movie_document(document):
+    """Разбирает JSON-документ из PostgreSQL в тот же dict, что отдаёт
+    MoviesApiMixin.movie_serialize."""
+    movie = json.loads(document)
+    # json в PostgreSQL пишет float8 0 как "0", а API всегда отдавал 0.0
+    if movie['rating'] is not None:
+        movie['rating'] = float(movie['rating'])
+
+    return movie
@@ -0,0 +1,94 @@
+import json
+import re
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class RawJSON:
+    """Уже сериализованный фрагмент JSON (например, документ фильма из
+    content.movie_documents), который вставляется в ответ как есть,
+    без json.loads и повторного кодирования."""
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+
+# Фрагменты временно заменяются строками-метками; \0 кодировщик всегда
+# экранирует как \u0000, поэтому метка не совпадёт с обычным текстом
+_FRAGMENT_MARK = '\0{}\0'
+_FRAGMENT_RE = re.compile(r'"\\u0000(\d+)\\u0000"')
+
+
+def _splice_fragments(text, fragments):
+    if not fragments:
+        return text
+
+    return _FRAGMENT_RE.sub(lambda m: fragments[int(m.group(1))], text)
+
+
+class StdlibBackend:
+    """json из стандартной библиотеки, вывод совпадает с JsonResponse."""
+    name = 'stdlib'
+
+    def dumps(self, obj):
+        fragments = []
+        django_default = DjangoJSONEncoder().default
+
+        def default(o):
+            if isinstance(o, RawJSON):
+                fragments.append(o.text)
+                return _FRAGMENT_MARK.format(len(fragments) - 1)
+            return django_default(o)
+
+        text = json.dumps(obj, cls=DjangoJSONEncoder, default=default)
+
+        return _splice_fragments(text, fragments).encode()
+
+
+class OrjsonBackend:
+    """orjson: даты, datetime и UUID кодируются без Python-хука default,
+    UTF-8 пишется без \\u-экранирования."""
+    name = 'orjson'
+
+    def dumps(self, obj):
+        fragments = []
+        django_default = DjangoJSONEncoder().default
+        native_fragments = hasattr(orjson, 'Fragment')
+
+        def default(o):
+            if isinstance(o, RawJSON):
+                # orjson >= 3.9 умеет вставлять готовый JSON сам
+                if native_fragments:
+                    return orjson.Fragment(o.text)
+                fragments.append(o.text)
+                return _FRAGMENT_MARK.format(len(fragments) - 1)
+            return django_default(o)
+
+        data = orjson.dumps(obj, default=default)
+        if fragments:
+            data = _splice_fragments(data.decode(), fragments).encode()
+
+        return data
+
+
+JSON_BACKENDS = {
+    StdlibBackend.name: StdlibBackend,
+    OrjsonBackend.name: OrjsonBackend,
+}
+
+
+def get_json_backend(name='auto'):
+    """'auto' выбирает orjson, если он установлен, иначе stdlib."""
+    if name == 'auto':
+        name = OrjsonBackend.name if orjson else StdlibBackend.name
+
+    if name == OrjsonBackend.name and orjson is None:
+        raise ImportError('orjson is not installed')
+
+    return JSON_BACKENDS[name]()
@@ -0,0 +1,135 @@
+import datetime
+import json
+import random
+import string
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from movies.encoders import RawJSON, get_json_backend, orjson
+
+
+def random_name(rnd):
+    return '{} {}'.format(
+        ''.join(rnd.choices(string.ascii_letters, k=rnd.randint(4, 9))),
+        ''.join(rnd.choices('абвгдеёжзийклмнопрстуфхцчшщэюя', k=8)),
+    )
+
+
+def make_page(rnd, page_size, actors):
+    """Страница /api/v1/movies/, похожая на настоящую: у каждого фильма
+    описание ~500 символов и actors..2*actors актёров."""
+    results = []
+    for i in range(page_size):
+        results.append({
+            "id": i + 1,
+            "title": random_name(rnd),
+            "description": ' '.join(random_name(rnd) for _ in range(30)),
+            "creation_date": datetime.date(
+                rnd.randint(1950, 2021), rnd.randint(1, 12), rnd.randint(1, 28)
+            ),
+            "rating": round(rnd.uniform(0, 10), 1),
+            "type": "фильм",
+            "genres": [random_name(rnd) for _ in range(3)],
+            "actors": [
+                random_name(rnd) for _ in range(rnd.randint(actors, 2 * actors))
+            ],
+            "directors": [random_name(rnd) for _ in range(2)],
+            "writers": [random_name(rnd) for _ in range(3)],
+        })
+
+    return {
+        "count": 1000000,
+        "total_pages": 20000,
+        "prev": None,
+        "next": 2,
+        "results": results,
+    }
+
+
+def preconverted(page):
+    page = dict(page)
+    page["results"] = [
+        dict(m, creation_date=m["creation_date"].isoformat())
+        for m in page["results"]
+    ]
+    return page
+
+
+def with_fragments(page):
+    page = dict(page)
+    page["results"] = [
+        RawJSON(json.dumps(m, cls=DjangoJSONEncoder))
+        for m in page["results"]
+    ]
+    return page
+
+
+class Command(BaseCommand):
+    help = 'Compares JSON encoder backends on realistic movie list pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pages',
+            type=int,
+            default=20,
+            help='The number of distinct pages to encode',
+        )
+        parser.add_argument(
+            '--page_size',
+            type=int,
+            default=50,
+            help='The number of movies on a page',
+        )
+        parser.add_argument(
+            '--actors',
+            type=int,
+            default=20,
+            help='Minimal number of actors per movie',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='How many times each backend encodes all pages',
+        )
+
+    def handle(self, *args, **options):
+        rnd = random.Random(0)
+        pages = [
+            make_page(rnd, options['page_size'], options['actors'])
+            for _ in range(options['pages'])
+        ]
+
+        cases = [
+            ('JsonResponse (stdlib, date objects)', pages,
+             lambda p: json.dumps(p, cls=DjangoJSONEncoder).encode()),
+            ('stdlib, pre-converted dates', list(map(preconverted, pages)),
+             get_json_backend('stdlib').dumps),
+            ('stdlib, pre-serialized fragments',
+             list(map(with_fragments, pages)),
+             get_json_backend('stdlib').dumps),
+        ]
+        if orjson:
+            cases += [
+                ('orjson, date objects', pages,
+                 get_json_backend('orjson').dumps),
+                ('orjson, pre-serialized fragments',
+                 list(map(with_fragments, pages)),
+                 get_json_backend('orjson').dumps),
+            ]
+        else:
+            print("orjson is not installed, skipping its backend")
+
+        for title, data, dumps in cases:
+            size = sum(len(dumps(page)) for page in data)
+            seconds = min(timeit.repeat(
+                lambda: [dumps(page) for page in data],
+                number=1,
+                repeat=options['repeat'],
+            ))
+            print("%-40s %8.3f ms/page %8.1f KB/page" % (
+                title,
+                seconds / len(data) * 1000,
+                size / len(data) / 1024,
+            ))
@@ -0,0 +1,45 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from movies.documents import iter_ndjson_chunks
+
+
+class Command(BaseCommand):
+    help = 'Exports the whole movie catalog as newline-delimited JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            type=str,
+            default='-',
+            help='File to write to, "-" for stdout',
+        )
+        parser.add_argument(
+            '--after',
+            type=int,
+            default=None,
+            help='Resume after the movie with this id',
+        )
+        parser.add_argument(
+            '--chunk_size',
+            type=int,
+            default=1000,
+            help='The number of rows fetched from the server-side cursor '
+            'at a time',
+        )
+
+    def handle(self, *args, **options):
+        if options['output'] == '-':
+            output = sys.stdout
+        else:
+            # при продолжении выгрузки файл дописывается
+            mode = 'a' if options['after'] is not None else 'w'
+            output = open(options['output'], mode, encoding='utf-8')
+
+        try:
+            for chunk in iter_ndjson_chunks(
+                    options['after'], options['chunk_size']):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
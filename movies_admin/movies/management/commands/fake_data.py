@@ -1,5 +1,27 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
 from dataclasses import dataclass, field
+
+import django
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from movies.bulk_session import BulkLoadSession
+from movies.management.commands.rebuild_movie_documents import (
+    map_bounded,
+    refresh_batch,
+)
+from movies.tests.factories.bulk import (
+    GENRE_COLUMNS,
+    MOVIE_COLUMNS,
+    MOVIE_GENRE_COLUMNS,
+    MOVIE_PERSON_ROLE_COLUMNS,
+    PERSON_COLUMNS,
+    CopyJob,
+    reserve_ids,
+    run_copy_job,
+)
 from movies.tests.factories.certificate_factory import CertificateFactory
 from movies.tests.factories.genre_factory import GenreFactory
 from movies.tests.factories.person_factory import PersonFactory
@@ -21,11 +43,31 @@ from movies.models import (
 from django.db.utils import IntegrityError
 
 
+# фабрики и методы BulkFaker (метод, колонки, merge) по моделям
+FACTORIES = {
+    Person: PersonFactory,
+    Genre: GenreFactory,
+    Movie: MovieFactory,
+    MoviePersonRole: MoviePersonRoleRandomFactory,
+    MovieGenre: MovieGenreRandomFactory,
+}
+
+COPY_METHODS = {
+    Person: ('person_lines', PERSON_COLUMNS, False),
+    Genre: ('genre_lines', GENRE_COLUMNS, True),
+    Movie: ('movie_lines', MOVIE_COLUMNS, False),
+    MoviePersonRole: ('link_lines', MOVIE_PERSON_ROLE_COLUMNS, True),
+    MovieGenre: ('link_lines', MOVIE_GENRE_COLUMNS, True),
+}
+
+
 @dataclass(frozen=False)
 class Interval():
     type: str
     min: int = field(default=1)
     max: int = field(default=1)
+    # задан ли интервал через include
+    included: bool = field(default=False, repr=False)
 
     def __str__(self) -> str:
         return "min: %s max: %s (%s)" % (self.min, self.max, self.type)
@@ -34,6 +76,15 @@ class Interval():
         if self.min == self.max:
             self.min = 1
 
+    def include(self, low, high):
+        """Расширяет интервал до [low, high]; первый вызов задаёт его."""
+        if not self.included:
+            self.min, self.max = low, high
+            self.included = True
+        else:
+            self.min = min(self.min, low)
+            self.max = max(self.max, high)
+
 
 @dataclass(frozen=False)
 class GenreInterval(Interval):
@@ -100,6 +151,46 @@ class Command(BaseCommand):
             help='Determines how much more the total '
             'number of links of films with writers will be',
         )
+        parser.add_argument(
+            '--engine',
+            choices=('bulk', 'factory'),
+            default='bulk',
+            help='bulk - columns generated in bulk and written with COPY '
+            '(default), factory - factory_boy objects and bulk_create',
+        )
+        parser.add_argument(
+            '--movie_skew',
+            type=float,
+            default=0.5,
+            help='Zipf exponent of the number of links per movie, '
+            '0 - uniform (bulk engine only)',
+        )
+        parser.add_argument(
+            '--link_skew',
+            type=float,
+            default=0.6,
+            help='Zipf exponent of the number of movies per person '
+            'and per genre, 0 - uniform (bulk engine only)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='The number of processes generating and writing '
+            'batches (bulk engine only)',
+        )
+        parser.add_argument(
+            '--bulk_session',
+            action='store_true',
+            help='Drop secondary indexes and foreign keys for the load, '
+            'then rebuild and validate them (bulk engine only)',
+        )
+        parser.add_argument(
+            '--maintenance_work_mem',
+            default='512MB',
+            help='maintenance_work_mem for rebuilding one index '
+            '(with --bulk_session)',
+        )
 
     def get_max_pk_id(self, manager):
         result = 1
@@ -109,6 +200,16 @@ class Command(BaseCommand):
 
         return result
 
+    def get_batches(self, total_count, batch_size=10000):
+        batches = []
+        if total_count > batch_size:
+            batches = [batch_size] * int(total_count / batch_size)
+            batches.append(total_count % batch_size)
+        else:
+            batches = [total_count]
+
+        return batches
+
     def fillin_catalog(
             self, factory_manager, manager,
             total_count=10, **kwargs):
@@ -131,15 +232,8 @@ class Command(BaseCommand):
             factory_manager.reset_sequence(kwargs['interval'].min+1)
 
         batch_size = 10000
-        batches = []
-        if total_count > batch_size:
-            batches = [batch_size] * int(total_count / batch_size)
-            batches.append(total_count % batch_size)
-        else:
-            batches = [total_count]
-
         count = 0
-        for size in batches:
+        for size in self.get_batches(total_count, batch_size):
             count += size
             genres = factory_manager.build_batch(
                 size,
@@ -164,23 +258,262 @@ class Command(BaseCommand):
 
         return True
 
-    def handle(self, *args, **options):
-        person_interval = PersonInterval()
+    def copy_catalog(
+            self, method, model, columns,
+            total_count=10, **kwargs):
+        """То же, что fillin_catalog, но пачки генерирует метод BulkFaker
+        method, а пишет COPY; при --workers > 1 пачки обрабатываются
+        параллельно в отдельных процессах.
+
+        interval - под строки заранее резервируется диапазон id
+        (reserve_ids): у каждой пачки свой непересекающийся поддиапазон,
+        интервал складывается из них.
+        partition - интервал фильмов для связей: каждая пачка получает
+        свой непересекающийся поддиапазон фильмов и число связей,
+        пропорциональное его длине.
+        per_movie - сколько разных связей может быть у одного фильма
+        (размер второго интервала связи).
+        args - дополнительные аргументы method после размера пачки.
+        merge=True - через временную таблицу с ON CONFLICT DO NOTHING
+        и отбрасыванием ссылок на несуществующие id (references).
+
+        Если записано меньше total_count строк (заказ невыполним или
+        строки отброшены при merge) - CommandError.
+        """
+        print("Start processing %s (COPY)" % model.__name__)
+        started = time.monotonic()
+
+        interval = kwargs.get('interval', None)
+        if interval:
+            with connection.cursor() as cursor:
+                first_id = reserve_ids(cursor, model, total_count)
+
+        partition = kwargs.get('partition', None)
+        if partition:
+            movies = partition.max - partition.min + 1
+            offset = carry = 0
+
+        jobs = []
+        for size in self.get_batches(total_count):
+            if not size:
+                continue
+            if interval:
+                args = (first_id, size) + kwargs.get('args', ())
+                interval.include(first_id, first_id + size - 1)
+                first_id += size
+            elif partition:
+                low = partition.min + offset * movies // total_count
+                offset += size
+                high = partition.min + offset * movies // total_count - 1
+                if high < low:
+                    # на пачку не пришлось ни одного фильма - её связи
+                    # переходят в следующую
+                    carry += size
+                    continue
+                args = (low, high, size + carry) + kwargs.get('args', ())
+                carry = 0
+            else:
+                args = (size,) + kwargs.get('args', ())
+            self.job_seed += 1
+            jobs.append(CopyJob(
+                model=model.__name__,
+                columns=columns,
+                method=method,
+                args=args,
+                seed=self.job_seed,
+                merge=kwargs.get('merge', False),
+                references=tuple(
+                    (column, reference.__name__)
+                    for column, reference in kwargs.get('references', ())
+                ),
+            ))
+
+        if partition and carry:
+            # связи пропущенных последних пачек достаются последней
+            # пачке с фильмами, иначе их было бы меньше заказанного
+            if not jobs:
+                raise CommandError(
+                    'No movies to link %s to' % model.__name__
+                )
+            low, high, size = jobs[-1].args[:3]
+            jobs[-1].args = (low, high, size + carry) + jobs[-1].args[3:]
+
+        per_movie = kwargs.get('per_movie', None)
+        if partition and per_movie:
+            for job in jobs:
+                low, high, size = job.args[:3]
+                if size > (high - low + 1) * per_movie:
+                    raise CommandError(
+                        'Cannot make %s distinct %s links for movies '
+                        '%s-%s: at most %s per movie' % (
+                            size, model.__name__, low, high, per_movie
+                        )
+                    )
+
+        if interval and not jobs:
+            interval.min = interval.max = self.get_max_pk_id(model)
+
+        if self.executor is None:
+            results = map(run_copy_job, jobs)
+        else:
+            results = (
+                future.result()
+                for future in as_completed(
+                    [self.executor.submit(run_copy_job, job) for job in jobs]
+                )
+            )
+
+        count = 0
+        for size in results:
+            count += size
+            print("Processed %s / %s" % (count, total_count))
+
+        if count != total_count:
+            raise CommandError(
+                'Wrote %s of %s %s rows: the rest were dropped as '
+                'conflicts or links to missing ids' % (
+                    count, total_count, model.__name__
+                )
+            )
+
+        print("Finish processing %s in %.1f s" % (
+            model.__name__, time.monotonic() - started
+        ))
+
+        return True
+
+    def refresh_movies(self, interval, batch_size=1000):
+        """search_vector и документы API созданных фильмов: bulk_create
+        и COPY не отправляют сигналов, которые их обновляют. Пачки id
+        раздаются процессам --workers, как в rebuild_movie_documents."""
+        print("Start refreshing search vectors and documents")
+        started = time.monotonic()
+        total = interval.max - interval.min + 1
+        batches = (
+            range(low, min(low + batch_size, interval.max + 1))
+            for low in range(interval.min, interval.max + 1, batch_size)
+        )
+        if self.executor is None:
+            results = map(refresh_batch, batches)
+        else:
+            results = map_bounded(
+                self.executor, refresh_batch, batches, self.workers * 2
+            )
+
+        count = 0
+        for refreshed in results:
+            count += refreshed
+            print("Processed %s / %s" % (count, total))
+
+        print("Finish refreshing in %.1f s" % (time.monotonic() - started))
+
+    def handle_bulk(self, options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+
+        self.job_seed = 0
+        self.workers = options['workers']
+        self.executor = None
+        if options['workers'] > 1:
+            # spawn: соединение с БД родителя не наследуется, каждый
+            # процесс заново настраивает Django и открывает своё
+            self.executor = ProcessPoolExecutor(
+                options['workers'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup,
+            )
+
+        session = nullcontext()
+        if options['bulk_session']:
+            session = BulkLoadSession(
+                lambda: connection.get_new_connection(
+                    connection.get_connection_params()
+                ),
+                [
+                    '"{}"'.format(model._meta.db_table)
+                    for model in (
+                        Person, Genre, Movie, MovieGenre, MoviePersonRole
+                    )
+                ],
+                workers=max(options['workers'], 2),
+                maintenance_work_mem=options['maintenance_work_mem'],
+            )
+
+        try:
+            with session:
+                movie_interval = self.generate(options, self.fill_copy)
+            # после сессии: документы собираются по индексам таблиц
+            # связей, которые сессия только что построила заново
+            self.refresh_movies(movie_interval)
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+
+        self.stdout.write(self.style.SUCCESS('Success'))
+
+    def fill_factory(self, options, model, total_count,
+                     interval=None, link=None, partition=None, **params):
+        """Строки model через factory_boy и bulk_create (--engine factory).
+        params - значения полей модели (type, person_role)."""
         self.fillin_catalog(
-            PersonFactory,
+            FACTORIES[model],
+            model,
+            interval=interval,
+            factory_intervals=[link, partition] if link else None,
+            factory_params=params,
+            total_count=total_count,
+        )
+
+    def fill_copy(self, options, model, total_count,
+                  interval=None, link=None, partition=None, **params):
+        """Строки model через BulkFaker и COPY (--engine bulk); значения
+        params передаются методу BulkFaker их id."""
+        method, columns, merge = COPY_METHODS[model]
+        args = tuple(value.id for value in params.values())
+        kwargs = {}
+        if link:
+            # связь: фильмы берутся из partition, вторая сторона - из link
+            args = (link, options['movie_skew'], options['link_skew']) + args
+            field = model._meta.get_field(link.type)
+            kwargs = dict(
+                partition=partition,
+                per_movie=link.max - link.min + 1,
+                references=(
+                    ('movie_id', Movie),
+                    (field.column, field.related_model),
+                ),
+            )
+
+        self.copy_catalog(
+            method,
+            model,
+            columns,
+            interval=interval,
+            args=args,
+            merge=merge,
+            total_count=total_count,
+            **kwargs
+        )
+
+    def generate(self, options, fill):
+        """Порядок генерации, общий для обоих движков: fill - fill_copy
+        или fill_factory. Возвращает интервал id созданных фильмов."""
+        person_interval = PersonInterval()
+        fill(
+            options,
             Person,
+            options['count_persons'],
             interval=person_interval,
-            total_count=options['count_persons']
         )
 
         person_interval.normalize()
 
         genre_interval = GenreInterval()
-        self.fillin_catalog(
-            GenreFactory,
+        fill(
+            options,
             Genre,
+            options['count_genres'],
             interval=genre_interval,
-            total_count=options['count_genres']
         )
 
         genre_interval.normalize()
@@ -189,25 +522,21 @@ class Command(BaseCommand):
         type_show = MovieTypeFactory(name='сериал')
 
         movie_interval = MovieInterval()
-        self.fillin_catalog(
-            MovieFactory,
+        fill(
+            options,
             Movie,
+            options['count_movies'],
             interval=movie_interval,
-            factory_params=dict(
-                type=type_movie
-            ),
-            total_count=options['count_movies']
+            type=type_movie,
         )
 
         movie_interval_show = MovieInterval()
-        self.fillin_catalog(
-            MovieFactory,
+        fill(
+            options,
             Movie,
+            int(options['count_movies'] / 5),
             interval=movie_interval_show,
-            factory_params=dict(
-                type=type_show
-            ),
-            total_count=int(options['count_movies'] / 5)
+            type=type_show,
         )
 
         movie_interval.max = movie_interval_show.max
@@ -216,45 +545,35 @@ class Command(BaseCommand):
         director = PersonRoleFactory(name='директор')
         writer = PersonRoleFactory(name='сценарист')
 
-        mp_count = options['movie_actor_coeff']*options['count_movies']
-        self.fillin_catalog(
-            MoviePersonRoleRandomFactory,
-            MoviePersonRole,
-            factory_intervals=[person_interval, movie_interval],
-            factory_params=dict(
-                person_role=actor
-            ),
-            total_count=mp_count,
-        )
+        for role, coeff in (
+            (actor, 'movie_actor_coeff'),
+            (director, 'movie_director_coeff'),
+            (writer, 'movie_writer_coeff'),
+        ):
+            fill(
+                options,
+                MoviePersonRole,
+                options[coeff]*options['count_movies'],
+                link=person_interval,
+                partition=movie_interval,
+                person_role=role,
+            )
 
-        mp_count = options['movie_director_coeff']*options['count_movies']
-        self.fillin_catalog(
-            MoviePersonRoleRandomFactory,
-            MoviePersonRole,
-            factory_intervals=[person_interval, movie_interval],
-            factory_params=dict(
-                person_role=director
-            ),
-            total_count=mp_count,
+        fill(
+            options,
+            MovieGenre,
+            options['movie_genre_coeff']*options['count_movies'],
+            link=genre_interval,
+            partition=movie_interval,
         )
 
-        mp_count = options['movie_writer_coeff']*options['count_movies']
-        self.fillin_catalog(
-            MoviePersonRoleRandomFactory,
-            MoviePersonRole,
-            factory_intervals=[person_interval, movie_interval],
-            factory_params=dict(
-                person_role=writer
-            ),
-            total_count=mp_count,
-        )
+        return movie_interval
 
-        mg_count = options['movie_genre_coeff']*options['count_movies']
-        self.fillin_catalog(
-            MovieGenreRandomFactory,
-            MovieGenre,
-            factory_intervals=[genre_interval, movie_interval],
-            total_count=mg_count,
-        )
+    def handle(self, *args, **options):
+        if options['engine'] == 'bulk':
+            return self.handle_bulk(options)
+
+        self.executor = None
+        self.refresh_movies(self.generate(options, self.fill_factory))
 
         self.stdout.write(self.style.SUCCESS('Success'))
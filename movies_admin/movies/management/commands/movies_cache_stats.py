@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from movies.cache import movie_response_cache
+
+
+class Command(BaseCommand):
+    help = 'Shows hit/miss counters of the movie detail response cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Reset the counters after printing them',
+        )
+
+    def handle(self, *args, **options):
+        stats = movie_response_cache.stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total * 100 if total else 0
+
+        print("hits: %s misses: %s (hit ratio %.1f%%)" % (
+            stats['hits'], stats['misses'], ratio
+        ))
+
+        if options['reset']:
+            movie_response_cache.reset_stats()
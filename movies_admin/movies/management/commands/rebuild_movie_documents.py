@@ -0,0 +1,92 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from movies.documents import (
+    delete_orphan_movie_documents,
+    refresh_movie_documents,
+)
+from movies.models import Movie
+from movies.search import refresh_search_vectors
+
+
+def map_bounded(executor, function, items, window):
+    """executor.map, который не читает items целиком заранее: в работе
+    не больше window задач, как в ограниченной очереди конвейера
+    load_data. Результаты идут в порядке items."""
+    pending = deque()
+    for item in items:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(function, item))
+
+    while pending:
+        yield pending.popleft().result()
+
+
+def refresh_batch(ids):
+    """search_vector и документы пачки фильмов; возвращает число
+    документов. Функция модуля, чтобы её можно было отдать и потоку,
+    и процессу (fake_data --workers)."""
+    # каждая пачка коммитится отдельно: таблица остаётся доступной
+    # на чтение, а блокируются только строки текущей пачки
+    try:
+        refresh_search_vectors(ids)
+        return refresh_movie_documents(ids)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds content.movie_documents and movies.search_vector '
+        'for the whole catalog'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=1000,
+            help='The number of movies refreshed in one statement',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='The number of concurrent database connections',
+        )
+
+    def iter_batches(self, batch_size):
+        last_id = 0
+        while True:
+            ids = list(
+                Movie.objects.filter(
+                    pk__gt=last_id
+                ).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+
+            yield ids
+            last_id = ids[-1]
+
+    def handle(self, *args, **options):
+        total = Movie.objects.count()
+        print("Start rebuilding documents for %s movies" % total)
+
+        count = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for refreshed in map_bounded(
+                    executor,
+                    refresh_batch,
+                    self.iter_batches(options['batch_size']),
+                    options['workers'] * 2):
+                count += refreshed
+                print("Processed %s / %s" % (count, total))
+
+        deleted = delete_orphan_movie_documents()
+        print("Deleted %s orphan documents" % deleted)
+
+        self.stdout.write(self.style.SUCCESS('Success'))
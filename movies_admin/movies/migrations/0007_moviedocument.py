@@ -0,0 +1,29 @@
+# Generated by Django 3.1 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_auto_20210803_1800'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieDocument',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True,
+                 related_name='movie_document', serialize=False, to='movies.movie', verbose_name='film work')),
+                ('document', models.TextField(verbose_name='document')),
+                ('modified', models.DateTimeField(
+                    auto_now=True, verbose_name='date of update')),
+            ],
+            options={
+                'verbose_name': 'film document',
+                'verbose_name_plural': 'film documents',
+                'db_table': 'content"."movie_documents',
+            },
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 3.1 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+# Таблицы, изменение которых меняет ответы API
+CATALOG_TABLES = (
+    'movies',
+    'movie_genre',
+    'movie_person_role',
+    'genres',
+    'persons',
+    'movie_types',
+)
+
+CREATE_TRIGGERS = """
+INSERT INTO content.catalog_version (id, version, modified)
+    VALUES (1, 0, now());
+
+CREATE FUNCTION content.bump_catalog_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE content.catalog_version
+        SET version = version + 1, modified = now()
+        WHERE id = 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+""" + "".join(
+    """
+CREATE TRIGGER {table}_catalog_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON content.{table}
+    FOR EACH STATEMENT EXECUTE PROCEDURE content.bump_catalog_version();
+""".format(table=table) for table in CATALOG_TABLES
+)
+
+DROP_TRIGGERS = "".join(
+    "DROP TRIGGER {table}_catalog_version ON content.{table};\n".format(
+        table=table
+    ) for table in CATALOG_TABLES
+) + "DROP FUNCTION content.bump_catalog_version();\n"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0007_moviedocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True,
+                 primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(
+                    default=0, verbose_name='version')),
+                ('modified', models.DateTimeField(
+                    auto_now=True, verbose_name='date of update')),
+            ],
+            options={
+                'verbose_name': 'catalog version',
+                'verbose_name_plural': 'catalog versions',
+                'db_table': 'content"."catalog_version',
+            },
+        ),
+        migrations.RunSQL(
+            sql=CREATE_TRIGGERS,
+            reverse_sql=DROP_TRIGGERS,
+        ),
+    ]
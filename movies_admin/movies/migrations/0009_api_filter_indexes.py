@@ -0,0 +1,52 @@
+# Generated by Django 3.1 on 2026-10-18 12:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции,
+    # зато он не блокирует запись в большие таблицы каталога
+    atomic = False
+
+    dependencies = [
+        ('movies', '0008_catalogversion'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='movie',
+            index=models.Index(
+                fields=['created', 'id'], name='movies_created_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='movie',
+            index=models.Index(
+                fields=['rating', 'id'], name='movies_rating_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='movie',
+            index=models.Index(
+                fields=['title', 'id'], name='movies_title_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='movie',
+            index=models.Index(condition=models.Q(creation_date__isnull=False), fields=[
+                               'creation_date', 'id'], name='movies_creation_date_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='movie',
+            index=models.Index(
+                fields=['type', 'rating', 'id'], name='movies_type_rating_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='moviegenre',
+            index=models.Index(
+                fields=['genre', 'movie'], name='movie_genre_genre_movie_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='moviepersonrole',
+            index=models.Index(
+                fields=['person', 'movie'], name='mpr_person_movie_idx'),
+        ),
+    ]
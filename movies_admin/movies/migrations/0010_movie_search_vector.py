@@ -0,0 +1,39 @@
+# Generated by Django 3.1 on 2026-10-18 12:00
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# movies.search.search_vector_sql на момент миграции
+FILL_SEARCH_VECTOR = """
+UPDATE content.movies m SET search_vector =
+    setweight(to_tsvector('russian', coalesce(m.title, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce(m.description, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(m.title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(m.description, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce((
+        SELECT string_agg(p.full_name, ' ')
+            FROM content.movie_person_role mpr
+            JOIN content.persons p ON p.id = mpr.person_id
+            WHERE mpr.movie_id = m.id
+    ), '')), 'C')
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0009_api_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True, verbose_name='search vector'),
+        ),
+        migrations.RunSQL(
+            sql=FILL_SEARCH_VECTOR,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.1 on 2026-10-18 12:00
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('movies', '0010_movie_search_vector'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='movie',
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=['search_vector'], name='movies_search_vector_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1 on 2026-10-18 12:00
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Индексы по выражению: нечёткий поиск не различает регистр и ё/е
+# (см. movies.search.normalized)
+TRIGRAM_INDEXES = (
+    ('persons_full_name_trgm_idx', 'persons', 'full_name'),
+    ('movies_title_trgm_idx', 'movies', 'title'),
+)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('movies', '0011_movies_search_vector_idx'),
+    ]
+
+    operations = [TrigramExtension()] + [
+        migrations.RunSQL(
+            sql="CREATE INDEX CONCURRENTLY {name} ON content.{table} "
+                "USING gin (replace(lower({column}), 'ё', 'е') gin_trgm_ops)"
+                .format(name=name, table=table, column=column),
+            reverse_sql="DROP INDEX CONCURRENTLY content.{}".format(name),
+        ) for name, table, column in TRIGRAM_INDEXES
+    ]
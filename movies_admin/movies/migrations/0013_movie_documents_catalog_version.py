@@ -0,0 +1,31 @@
+# Generated by Django 3.1 on 2026-10-18 12:00
+
+from django.db import migrations
+
+# API отдаёт документы из movie_documents (stored_movie_document), а их
+# пересобирают после коммита (movies.signals, rebuild_movie_documents) -
+# позже, чем срабатывают триггеры CATALOG_TABLES из 0008. Без своего
+# триггера кеш успел бы закрепить старый документ под новой версией.
+CREATE_TRIGGER = """
+CREATE TRIGGER movie_documents_catalog_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON content.movie_documents
+    FOR EACH STATEMENT EXECUTE PROCEDURE content.bump_catalog_version();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER movie_documents_catalog_version ON content.movie_documents;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0012_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=CREATE_TRIGGER,
+            reverse_sql=DROP_TRIGGER,
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.1 on 2026-10-18 12:00
+
+from django.contrib.postgres.operations import (
+    AddIndexConcurrently,
+    RemoveIndexConcurrently,
+)
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # частичный индекс (WHERE creation_date IS NOT NULL) не подходит для
+    # ?sort=creation_date без фильтра: строки с NULL тоже входят
+    # в ответ, и ORDER BY creation_date, id LIMIT n шёл через Seq Scan
+    atomic = False
+
+    dependencies = [
+        ('movies', '0013_movie_documents_catalog_version'),
+    ]
+
+    operations = [
+        RemoveIndexConcurrently(
+            model_name='movie',
+            name='movies_creation_date_id_idx',
+        ),
+        AddIndexConcurrently(
+            model_name='movie',
+            index=models.Index(
+                fields=['creation_date', 'id'],
+                name='movies_creation_date_id_idx'),
+        ),
+    ]
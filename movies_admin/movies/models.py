@@ -1,3 +1,5 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
@@ -145,11 +147,45 @@ class Movie(TimeStampedModel):
         'PersonRole',
         through='MoviePersonRole'
     )
+    # поддерживается movies.signals и командой rebuild_movie_documents
+    search_vector = SearchVectorField(
+        _('search vector'),
+        null=True,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = _('film work')
         verbose_name_plural = _('film works')
         db_table = 'content\".\"movies'
+        indexes = [
+            # сортировки и keyset-курсоры API: (поле, id)
+            models.Index(
+                fields=['created', 'id'],
+                name='movies_created_id_idx',
+            ),
+            models.Index(
+                fields=['rating', 'id'],
+                name='movies_rating_id_idx',
+            ),
+            models.Index(
+                fields=['title', 'id'],
+                name='movies_title_id_idx',
+            ),
+            models.Index(
+                fields=['creation_date', 'id'],
+                name='movies_creation_date_id_idx',
+            ),
+            # фильтр по типу с сортировкой по рейтингу
+            models.Index(
+                fields=['type', 'rating', 'id'],
+                name='movies_type_rating_idx',
+            ),
+            GinIndex(
+                fields=['search_vector'],
+                name='movies_search_vector_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -180,6 +216,13 @@ class MovieGenre(models.Model):
                 name='movie_genre_main_uidx'
             )
         ]
+        indexes = [
+            # фильмы жанра: уникальный индекс начинается с movie_id
+            models.Index(
+                fields=['genre', 'movie'],
+                name='movie_genre_genre_movie_idx',
+            ),
+        ]
 
 
 class PersonRole(TimeStampedModel):
@@ -221,3 +264,40 @@ class MoviePersonRole(models.Model):
                 name='movie_person_role_main_uidx'
             )
         ]
+        indexes = [
+            # фильмы персоны: уникальный индекс начинается с movie_id
+            models.Index(
+                fields=['person', 'movie'],
+                name='mpr_person_movie_idx',
+            ),
+        ]
+
+
+class MovieDocument(models.Model):
+    movie = models.OneToOneField(
+        Movie,
+        verbose_name=_('film work'),
+        related_name='movie_document',
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    # готовый JSON фильма в формате API (см. movies.documents)
+    document = models.TextField(_('document'))
+    modified = models.DateTimeField(_('date of update'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('film document')
+        verbose_name_plural = _('film documents')
+        db_table = 'content\".\"movie_documents'
+
+
+class CatalogVersion(models.Model):
+    # единственная строка (id=1), её обновляют триггеры PostgreSQL
+    # на таблицах каталога (миграция 0008)
+    version = models.BigIntegerField(_('version'), default=0)
+    modified = models.DateTimeField(_('date of update'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('catalog version')
+        verbose_name_plural = _('catalog versions')
+        db_table = 'content\".\"catalog_version'
@@ -0,0 +1,383 @@
+import base64
+import datetime
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from movies.models import CatalogVersion
+
+
+class InvalidQueryParam(ValueError):
+    pass
+
+
+class CursorPaginator:
+    """Keyset-пагинация: страница выбирается условием по ключу сортировки,
+    а не OFFSET, поэтому стоимость не зависит от глубины страницы.
+
+    Последнее поле ordering должно быть уникальным (обычно 'id').
+    """
+
+    def __init__(self, queryset, per_page, ordering=('created', 'id')):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = tuple(f.lstrip('-') for f in self.ordering)
+
+        # NULL не сравнивается через > и <, такие ключи не подходят
+        for name in self.fields:
+            if queryset.model._meta.get_field(name).null:
+                raise InvalidQueryParam(
+                    'Cursor pagination is not supported '
+                    'for ordering by {}'.format(name)
+                )
+
+    def encode_cursor(self, values, direction):
+        payload = json.dumps(
+            {
+                'o': self.ordering,
+                'v': [self._to_json(v) for v in values],
+                'd': direction,
+            },
+            separators=(',', ':'),
+        )
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padding = '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(cursor + padding))
+            ordering = tuple(payload['o'])
+            values = payload['v']
+            direction = payload['d']
+            if not isinstance(values, list):
+                raise TypeError('Cursor values must be a list')
+        except (ValueError, TypeError, KeyError):
+            raise InvalidQueryParam('Invalid cursor')
+
+        if ordering != self.ordering or len(values) != len(self.fields) \
+                or direction not in ('next', 'prev'):
+            raise InvalidQueryParam('Cursor does not match the ordering')
+
+        # значения приходят от клиента: всё, что не приводится к типу
+        # поля, - ошибка запроса, а не сервера
+        try:
+            values = [
+                self._to_python(f, v) for f, v in zip(self.fields, values)
+            ]
+        except (ValueError, TypeError, ValidationError):
+            raise InvalidQueryParam('Invalid cursor')
+
+        return values, direction
+
+    def _to_json(self, value):
+        # DjangoJSONEncoder обрезает время до миллисекунд, для ключа
+        # нужна полная точность
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return value.isoformat()
+        return value
+
+    def _to_python(self, field_name, value):
+        field = self.queryset.model._meta.get_field(field_name)
+        value = field.to_python(value)
+        # поля ключа NOT NULL, а с NULL условие > / < не строится
+        if value is None:
+            raise ValueError('Cursor value is empty')
+        return value
+
+    def _seek_filter(self, values, direction):
+        """(a, b) > (x, y)  ->  a > x OR (a = x AND b > y) с учётом
+        направления сортировки каждого поля."""
+        condition = Q()
+        for i, name in enumerate(self.ordering):
+            field = self.fields[i]
+            descending = name.startswith('-')
+            if direction == 'prev':
+                descending = not descending
+            lookup = 'lt' if descending else 'gt'
+
+            step = Q(**{'{}__{}'.format(field, lookup): values[i]})
+            for prev_field, prev_value in zip(self.fields[:i], values[:i]):
+                step &= Q(**{prev_field: prev_value})
+            condition |= step
+
+        return condition
+
+    def _reverse_ordering(self):
+        return tuple(
+            f[1:] if f.startswith('-') else '-' + f for f in self.ordering
+        )
+
+    def _key(self, obj):
+        return [getattr(obj, f) for f in self.fields]
+
+    def page(self, cursor=None):
+        """Возвращает (objects, prev_cursor, next_cursor)."""
+        direction = 'next'
+        queryset = self.queryset.order_by(*self.ordering)
+
+        if cursor:
+            values, direction = self.decode_cursor(cursor)
+            if direction == 'prev':
+                queryset = self.queryset.order_by(*self._reverse_ordering())
+            queryset = queryset.filter(self._seek_filter(values, direction))
+
+        objects = list(queryset[:self.per_page + 1])
+        has_more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+
+        if direction == 'prev':
+            objects.reverse()
+            has_next, has_prev = True, has_more
+        else:
+            has_next, has_prev = has_more, bool(cursor)
+
+        prev_cursor = next_cursor = None
+        if objects and has_prev:
+            prev_cursor = self.encode_cursor(self._key(objects[0]), 'prev')
+        if objects and has_next:
+            next_cursor = self.encode_cursor(self._key(objects[-1]), 'next')
+
+        return objects, prev_cursor, next_cursor
+
+
+def estimate_count(queryset):
+    """Оценка количества строк по статистике планировщика PostgreSQL.
+
+    Для выборки без условий берётся pg_class.reltuples таблицы, иначе
+    оценка Plan Rows из EXPLAIN самого запроса.
+    """
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [connection.ops.quote_name(queryset.model._meta.db_table)]
+            )
+            row = cursor.fetchone()
+            # reltuples = -1, если таблица ещё ни разу не анализировалась
+            if row and row[0] >= 0:
+                return row[0]
+
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def cached_count(queryset, timeout):
+    """Точный COUNT(*), закешированный по тексту запроса (сигнатуре
+    фильтра) на timeout секунд."""
+    sql, params = queryset.order_by().query.sql_with_params()
+    key = 'movies:count:{}'.format(
+        hashlib.md5(repr((sql, params)).encode()).hexdigest()
+    )
+
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+
+    return count
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, который считает общее количество по облегчённой выборке
+    count_queryset (без агрегатов) и кеширует результат."""
+
+    def __init__(self, object_list, per_page, count_queryset=None,
+                 count_timeout=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_queryset = count_queryset
+        self.count_timeout = count_timeout
+
+    @cached_property
+    def count(self):
+        queryset = self.count_queryset
+        if queryset is None:
+            queryset = self.object_list
+
+        return cached_count(queryset, self.count_timeout)
+
+
+def paginate_without_count(queryset, page_number, per_page):
+    """OFFSET-пагинация без общего количества: наличие следующей
+    страницы определяется по лишней (per_page + 1) строке.
+
+    Возвращает (objects, has_previous, has_next).
+    """
+    offset = (page_number - 1) * per_page
+    objects = list(queryset[offset:offset + per_page + 1])
+
+    return objects[:per_page], page_number > 1, len(objects) > per_page
+
+
+class AdminPaginator(Paginator):
+    """Paginator для списков админки на больших таблицах.
+
+    count: для выборки без фильтров, если в таблице не меньше
+    estimate_threshold строк, берётся оценка estimate_count вместо COUNT(*).
+    Конец списка по оценке не определяется: на последней по оценке
+    странице (и за ней) наличие строк проверяется запросом, и если
+    оценка ошиблась, количество пересчитывается точно.
+
+    page: начиная со страницы keyset_page страница выбирается по ключу
+    сортировки (как в CursorPaginator), а не по OFFSET. Ключ последней
+    строки каждой глубокой страницы кешируется, поэтому переход
+    на соседнюю страницу - это поиск по индексу. Ключи кешируются
+    под версией каталога (content.catalog_version): после вставки или
+    удаления строк старые границы страниц больше не читаются. Если ключ
+    предыдущей страницы неизвестен (прямой переход по номеру) или
+    сортировка не подходит для keyset, OFFSET выполняется только по id,
+    а строки выбираются отдельным запросом по найденным id.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0,
+                 allow_empty_first_page=True, estimate_threshold=100000,
+                 keyset_page=50, keyset_timeout=600):
+        super().__init__(object_list, per_page, orphans,
+                         allow_empty_first_page)
+        self.estimate_threshold = estimate_threshold
+        self.keyset_page = keyset_page
+        self.keyset_timeout = keyset_timeout
+        # count - оценка; exact - оценка отвергнута, нужен COUNT(*)
+        self.estimated = False
+        self.exact = False
+
+    @cached_property
+    def count(self):
+        if not self.exact and not self.object_list.query.where:
+            estimate = estimate_count(self.object_list)
+            if estimate >= self.estimate_threshold:
+                self.estimated = True
+                return estimate
+
+        self.estimated = False
+        return super().count
+
+    def _count_exactly(self):
+        self.exact = True
+        for name in ('count', 'num_pages'):
+            self.__dict__.pop(name, None)
+
+    def _has_row(self, offset):
+        return bool(list(
+            self.object_list.values_list('pk', flat=True)[offset:offset + 1]
+        ))
+
+    def validate_number(self, number):
+        try:
+            number = super().validate_number(number)
+        except EmptyPage:
+            # оценка могла оказаться меньше настоящего количества
+            if not (self.estimated and int(number) > 1 and
+                    self._has_row((int(number) - 1) * self.per_page)):
+                raise
+            self._count_exactly()
+            return super().validate_number(number)
+
+        # последняя страница по оценке: за ней не должно быть строк,
+        # а на ней самой - должны
+        if self.estimated and number == self.num_pages and (
+                self._has_row(number * self.per_page) or
+                not self._has_row((number - 1) * self.per_page)):
+            self._count_exactly()
+            number = min(number, self.num_pages)
+
+        return number
+
+    @cached_property
+    def _version(self):
+        return CatalogVersion.objects.filter(pk=1).values_list(
+            'version', flat=True
+        ).first()
+
+    @cached_property
+    def _keyset(self):
+        """CursorPaginator по сортировке выборки или None, если сортировка
+        не по собственным NOT NULL полям модели."""
+        queryset = self.object_list
+        ordering = []
+        for name in queryset.query.order_by:
+            if not isinstance(name, str):
+                return None
+            if name.lstrip('-') == 'pk':
+                name = name.replace('pk', queryset.model._meta.pk.name)
+            try:
+                field = queryset.model._meta.get_field(name.lstrip('-'))
+            except FieldDoesNotExist:
+                return None
+            # сортировка по ForeignKey идёт по ordering связанной модели,
+            # условие по ключу с ней не совпадает
+            if field.remote_field:
+                return None
+            ordering.append(name)
+
+        try:
+            return CursorPaginator(queryset, self.per_page, ordering)
+        except InvalidQueryParam:
+            return None
+
+    def _boundary_key(self, number):
+        """Ключ кеша для последней строки страницы number."""
+        sql, params = self.object_list.query.sql_with_params()
+        return 'movies:admin-page:{}:{}:{}:{}'.format(
+            hashlib.md5(repr((sql, params)).encode()).hexdigest(),
+            self._version,
+            self.per_page,
+            number,
+        )
+
+    def _save_boundary(self, number, objects):
+        keyset = self._keyset
+        if keyset is not None and objects:
+            cache.set(
+                self._boundary_key(number),
+                keyset._key(objects[-1]),
+                self.keyset_timeout,
+            )
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if number < self.keyset_page - 1:
+            return super().page(number)
+
+        if number == self.keyset_page - 1:
+            # последняя страница с OFFSET - ключ для первой глубокой
+            page = super().page(number)
+            page.object_list = list(page.object_list)
+            self._save_boundary(number, page.object_list)
+            return page
+
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        # по оценке конец не обрезается: строк вернёт сама выборка
+        if not self.estimated and top + self.orphans >= self.count:
+            top = self.count
+
+        keyset = self._keyset
+        values = None
+        if keyset is not None:
+            values = cache.get(self._boundary_key(number - 1))
+
+        if values is not None:
+            objects = list(self.object_list.filter(
+                keyset._seek_filter(values, 'next')
+            )[:top - bottom])
+        else:
+            ids = list(
+                self.object_list.values_list('pk', flat=True)[bottom:top]
+            )
+            objects = list(self.object_list.filter(pk__in=ids))
+
+        self._save_boundary(number, objects)
+        return self._get_page(objects, number, self)
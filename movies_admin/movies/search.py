@@ -0,0 +1,101 @@
+from django.contrib.postgres.search import SearchQuery, TrigramSimilarity
+from django.db import connections
+from django.db.models import Q, Value
+from django.db.models.functions import Lower, Replace
+from movies.models import Movie, MoviePersonRole, Person
+
+# Конфигурации полнотекстового поиска: каталог русско-английский,
+# имена персон индексируются без стемминга
+SEARCH_CONFIGS = ('russian', 'english')
+NAMES_CONFIG = 'simple'
+
+
+def _table(model):
+    return '"{}"'.format(model._meta.db_table)
+
+
+def search_vector_sql(movie_alias):
+    """SQL-выражение tsvector фильма: название (вес A), описание (B)
+    и имена всех персон фильма (C)."""
+    parts = []
+    for config in SEARCH_CONFIGS:
+        parts.append(
+            "setweight(to_tsvector('{config}', "
+            "coalesce({movie}.title, '')), 'A')".format(
+                config=config, movie=movie_alias
+            )
+        )
+        parts.append(
+            "setweight(to_tsvector('{config}', "
+            "coalesce({movie}.description, '')), 'B')".format(
+                config=config, movie=movie_alias
+            )
+        )
+
+    parts.append(
+        "setweight(to_tsvector('{config}', coalesce(("
+        "SELECT string_agg(p.full_name, ' ') "
+        "FROM {movie_person_role} mpr "
+        "JOIN {persons} p ON p.id = mpr.person_id "
+        "WHERE mpr.movie_id = {movie}.id"
+        "), '')), 'C')".format(
+            config=NAMES_CONFIG,
+            movie=movie_alias,
+            movie_person_role=_table(MoviePersonRole),
+            persons=_table(Person),
+        )
+    )
+
+    return ' || '.join(parts)
+
+
+def refresh_search_vectors(movie_ids, using='default'):
+    movie_ids = list(set(movie_ids))
+    if not movie_ids:
+        return 0
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "UPDATE {movies} m SET search_vector = {vector} "
+            "WHERE m.id = ANY(%s)".format(
+                movies=_table(Movie),
+                vector=search_vector_sql('m'),
+            ),
+            [movie_ids]
+        )
+
+        return cursor.rowcount
+
+
+def movie_search_query(text):
+    """Запрос, который ищет text во всех конфигурациях индекса."""
+    query = SearchQuery(text, config=NAMES_CONFIG)
+    for config in SEARCH_CONFIGS:
+        query = query | SearchQuery(text, config=config)
+
+    return query
+
+
+def normalize_name(text):
+    """Нормализация для нечёткого поиска: регистр и ё/е не различаются."""
+    return text.lower().replace('ё', 'е')
+
+
+def normalized(field):
+    # выражение должно совпадать с индексами *_trgm_idx из миграции 0012
+    return Replace(Lower(field), Value('ё'), Value('е'))
+
+
+def trigram_search(queryset, field, text):
+    """Поиск по GIN-индексу pg_trgm: похожие строки (оператор %) и
+    подстроки (LIKE), по убыванию похожести."""
+    text = normalize_name(text)
+
+    return queryset.annotate(
+        normalized_name=normalized(field),
+    ).annotate(
+        similarity=TrigramSimilarity('normalized_name', text),
+    ).filter(
+        Q(normalized_name__trigram_similar=text) |
+        Q(normalized_name__contains=text)
+    ).order_by('-similarity', 'pk')
@@ -0,0 +1,107 @@
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from movies.cache import movie_response_cache
+from movies.documents import refresh_movie_documents
+from movies.models import (
+    Genre,
+    Movie,
+    MovieGenre,
+    MoviePersonRole,
+    MovieType,
+    Person,
+)
+from movies.search import refresh_search_vectors
+
+
+def movies_changed(movie_ids, using='default'):
+    """Точка входа для всего, что зависит от содержимого фильмов.
+
+    Пересчёт откладывается до коммита транзакции: админка сохраняет фильм
+    и все инлайны в одной транзакции, документ должен увидеть итог.
+    """
+    movie_ids = set(movie_ids)
+    if not movie_ids:
+        return
+
+    def refresh():
+        refresh_movie_documents(movie_ids, using=using)
+        refresh_search_vectors(movie_ids, using=using)
+        # кеш сбрасывается после коммита, иначе параллельный запрос
+        # успеет закешировать старую версию
+        movie_response_cache.invalidate(movie_ids)
+
+    transaction.on_commit(refresh, using=using)
+
+
+def _linked_movie_ids(through, instance, using):
+    field = next(
+        f for f in through._meta.fields if f.related_model is type(instance)
+    )
+    return through.objects.using(using).filter(
+        **{field.attname: instance.pk}
+    ).values_list('movie_id', flat=True)
+
+
+def movie_saved(sender, instance, using, **kwargs):
+    movies_changed([instance.pk], using)
+
+
+def movie_deleted(sender, instance, using, **kwargs):
+    # у фильма без жанров и персон удаление связей сигналов не даёт:
+    # без этого кеш ответа жил бы до истечения срока
+    movies_changed([instance.pk], using)
+
+
+def link_changed(sender, instance, using, **kwargs):
+    movies_changed([instance.movie_id], using)
+
+
+def person_saved(sender, instance, using, **kwargs):
+    movies_changed(_linked_movie_ids(MoviePersonRole, instance, using), using)
+
+
+def genre_saved(sender, instance, using, **kwargs):
+    movies_changed(_linked_movie_ids(MovieGenre, instance, using), using)
+
+
+def movie_type_changed(sender, instance, using, **kwargs):
+    # при удалении типа фильмы получают NULL без post_save,
+    # поэтому список фильмов собирается в pre_delete
+    movies_changed(
+        Movie.objects.using(using).filter(
+            type_id=instance.pk
+        ).values_list('pk', flat=True),
+        using
+    )
+
+
+def m2m_links_changed(sender, instance, action, model, pk_set, using,
+                      **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if isinstance(instance, Movie):
+        movies_changed([instance.pk], using)
+    elif action == 'pre_clear':
+        movies_changed(_linked_movie_ids(sender, instance, using), using)
+    elif model is Movie:
+        movies_changed(pk_set or [], using)
+
+
+def connect_signals():
+    post_save.connect(movie_saved, sender=Movie)
+    post_delete.connect(movie_deleted, sender=Movie)
+    post_save.connect(person_saved, sender=Person)
+    post_save.connect(genre_saved, sender=Genre)
+    post_save.connect(movie_type_changed, sender=MovieType)
+    pre_delete.connect(movie_type_changed, sender=MovieType)
+
+    for through in (MovieGenre, MoviePersonRole):
+        post_save.connect(link_changed, sender=through)
+        post_delete.connect(link_changed, sender=through)
+        m2m_changed.connect(m2m_links_changed, sender=through)
@@ -0,0 +1,437 @@
+"""Быстрая генерация фейковых данных для команды fake_data.
+
+Фабрики factory_boy строят каждый объект отдельно и на каждое поле
+зовут Faker. Здесь Faker используется один раз: из него заранее
+набираются словари (имена, слова, пути к файлам). Сами строки собираются
+целыми столбцами из случайных индексов в эти словари и пишутся
+в Postgres через COPY.
+
+Если установлен NumPy, случайные столбцы генерируются им, иначе - модулем
+random.
+"""
+import datetime
+import functools
+import io
+import itertools
+import math
+import random
+from dataclasses import dataclass
+
+from django.apps import apps
+from django.db import connection, transaction
+from faker import Faker
+from movies.tests.factories.genre_factory import GENRE_LIST
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _table(model):
+    return '"{}"'.format(model._meta.db_table)
+
+
+def _copy_text(value):
+    """Строка в текстовом формате COPY."""
+    return (
+        value.replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+class RandomColumns:
+    """Случайные столбцы целиком (списки Python)."""
+
+    def __init__(self, seed=None):
+        self.seed = seed
+        if numpy is not None:
+            self._rng = numpy.random.default_rng(seed)
+        else:
+            self._random = random.Random(seed)
+
+    def integers(self, low, high, size):
+        """Целые из [low, high]."""
+        if numpy is not None:
+            return self._rng.integers(low, high + 1, size).tolist()
+
+        randrange = self._random.randrange
+        return [randrange(low, high + 1) for _ in range(size)]
+
+    def choice(self, values, size):
+        if numpy is not None:
+            return [
+                values[i]
+                for i in self._rng.integers(0, len(values), size).tolist()
+            ]
+
+        return self._random.choices(values, k=size)
+
+    def uniform(self, low, high, size, digits=1):
+        if numpy is not None:
+            return self._rng.uniform(low, high, size).round(digits).tolist()
+
+        rand = self._random.random
+        span = high - low
+        return [round(low + rand() * span, digits) for _ in range(size)]
+
+    def sample(self, low, high, size):
+        """size разных целых из [low, high)."""
+        if numpy is not None:
+            return (
+                self._rng.choice(high - low, size, replace=False) + low
+            ).tolist()
+
+        return self._random.sample(range(low, high), size)
+
+    def weighted(self, cum_weights, size):
+        """size индексов, выбранных по накопленным весам cum_weights."""
+        if numpy is not None:
+            points = self._rng.random(size) * cum_weights[-1]
+            return numpy.minimum(
+                numpy.searchsorted(cum_weights, points, side='right'),
+                len(cum_weights) - 1,
+            ).tolist()
+
+        return self._random.choices(
+            range(len(cum_weights)), cum_weights=cum_weights, k=size
+        )
+
+
+class Vocabulary:
+    """Словари, заранее набранные из Faker (уже в формате COPY)."""
+    _shared = None
+
+    def __init__(self, seed=0, size=1000):
+        fake = Faker(['ru_RU'])
+        fake.seed_instance(seed)
+
+        self.last_names = self._pool(fake.last_name, size)
+        self.first_names = self._pool(fake.first_name, size // 4)
+        self.middle_names = self._pool(fake.middle_name, size // 4)
+        self.words = self._pool(fake.word, size * 2)
+        self.file_paths = self._pool(
+            lambda: fake.file_path(depth=5, category='video'), size
+        )
+
+        first_day = datetime.date(1970, 1, 1).toordinal()
+        last_day = datetime.date.today().toordinal()
+        self.dates = [
+            datetime.date.fromordinal(day).isoformat()
+            for day in range(first_day, last_day + 1)
+        ]
+
+    @classmethod
+    def shared(cls):
+        """Один словарь на процесс: Faker опрашивается только один раз."""
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def _pool(self, make, size):
+        return sorted({_copy_text(make()) for _ in range(size)})
+
+
+# Множитель взаимно прост с длиной диапазонов ниже, поэтому
+# id -> low + (id * _SCATTER) % (high - low) - перестановка: разные id
+# дают разные значения без общего состояния между процессами
+_SCATTER = 48271
+
+
+def _scatter(first_id, size, low, high):
+    return [
+        low + (i * _SCATTER) % (high - low)
+        for i in range(first_id, first_id + size)
+    ]
+
+
+@functools.lru_cache(maxsize=16)
+def _power_law(size, exponent):
+    """Накопленные веса закона Ципфа 1 / rank ** exponent для рангов
+    1..size; exponent = 0 - равномерное распределение."""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)
+    ))
+
+
+def _rank_step(size):
+    """Шаг перестановки rank -> rank * step % size: популярные ранги
+    разбрасываются по всему интервалу id, а не идут подряд с начала."""
+    step = _SCATTER % size or 1
+    while math.gcd(step, size) != 1:
+        step += 1
+
+    return step
+
+
+class BulkFaker:
+    """Строки COPY для моделей каталога.
+
+    Строки справочников получают явные id из диапазона
+    [first_id, first_id + size), зарезервированного в последовательности
+    таблицы (reserve_ids), поэтому пачки можно генерировать и писать
+    в разных процессах независимо.
+    """
+
+    def __init__(self, seed=0, vocabulary=None):
+        self.columns = RandomColumns(seed)
+        self.vocabulary = vocabulary or Vocabulary.shared()
+        self.now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+    def texts(self, size, min_words, max_words):
+        """Предложения из словаря: первая буква заглавная, в конце точка."""
+        lengths = self.columns.integers(min_words, max_words, size)
+        words = self.columns.choice(self.vocabulary.words, sum(lengths))
+
+        result = []
+        position = 0
+        for length in lengths:
+            text = ' '.join(words[position:position + length])
+            position += length
+            result.append(text[:1].upper() + text[1:] + '.')
+
+        return result
+
+    def person_lines(self, first_id, size):
+        columns = self.columns
+        vocabulary = self.vocabulary
+        # ФИО склеивается из трёх словарей: фамилия, имя, отчество
+        return [
+            '{}\t{} {} {}\t{}\t{}\t{now}\t{now}'.format(*row, now=self.now)
+            for row in zip(
+                range(first_id, first_id + size),
+                columns.choice(vocabulary.last_names, size),
+                columns.choice(vocabulary.first_names, size),
+                columns.choice(vocabulary.middle_names, size),
+                columns.choice(vocabulary.dates, size),
+                columns.choice(('male', 'female'), size),
+            )
+        ]
+
+    def genre_lines(self, first_id, size):
+        # номер в названии уникален, как fake.unique в GenreFactory
+        return [
+            '{}\t{} {}\t\t{now}\t{now}'.format(*row, now=self.now)
+            for row in zip(
+                range(first_id, first_id + size),
+                self.columns.choice(GENRE_LIST, size),
+                _scatter(first_id, size, 1, 1000001),
+            )
+        ]
+
+    def movie_lines(self, first_id, size, type_id):
+        columns = self.columns
+        vocabulary = self.vocabulary
+        return [
+            '{}\t{}\t{}\ttt{}\t{}\t{}\t{}\t{type}\t{now}\t{now}'.format(
+                *row, type=type_id, now=self.now
+            )
+            for row in zip(
+                range(first_id, first_id + size),
+                self.texts(size, 1, 6),
+                self.texts(size, 10, 60),
+                _scatter(first_id, size, 10000000, 100000000),
+                columns.choice(vocabulary.dates, size),
+                columns.choice(vocabulary.file_paths, size),
+                columns.uniform(0, 10, size),
+            )
+        ]
+
+    def _spread(self, cum_weights, size, limit):
+        """Раскладывает size по len(cum_weights) корзинам по весам,
+        не больше limit в каждую; возвращает список размеров."""
+        counts = [0] * len(cum_weights)
+        if size > limit * len(counts):
+            raise ValueError(
+                'Cannot spread {} over {} buckets of at most {}'.format(
+                    size, len(counts), limit
+                )
+            )
+        while size:
+            for index in self.columns.weighted(cum_weights, size):
+                if counts[index] < limit:
+                    counts[index] += 1
+                    size -= 1
+
+        return counts
+
+    def link_lines(
+            self, low, high, size, second, movie_skew, link_skew, *extra):
+        """Ровно size разных связей фильмов из [low, high] с id
+        из интервала second (Interval); если разных пар меньше size -
+        ValueError.
+
+        Число связей на фильм и на объект second распределено по закону
+        Ципфа с показателями movie_skew и link_skew: у немногих фильмов
+        и персон связей много, у большинства - мало. Пары уникальны
+        внутри пачки, а пачки делят фильмы без пересечений, поэтому
+        ON CONFLICT ничего не отбрасывает.
+
+        К каждой паре добавляются значения extra и время создания.
+        """
+        movies = high - low + 1
+        seconds = second.max - second.min + 1
+        movie_step = _rank_step(movies)
+        second_step = _rank_step(seconds)
+        second_weights = _power_law(seconds, link_skew)
+
+        counts = self._spread(_power_law(movies, movie_skew), size, seconds)
+        chosen = [set() for _ in counts]
+        # выборка без повторов: недостающие пары добираются новыми
+        # розыгрышами, пока повторов не станет слишком много
+        for _ in range(8):
+            missing = [
+                (rank, counts[rank] - len(chosen[rank]))
+                for rank in range(movies)
+                if counts[rank] > len(chosen[rank])
+            ]
+            if not missing:
+                break
+            draws = iter(self.columns.weighted(
+                second_weights, sum(need for _, need in missing)
+            ))
+            for rank, need in missing:
+                chosen[rank].update(itertools.islice(draws, need))
+
+        tail = '\t'.join([str(value) for value in extra] + [self.now])
+        lines = []
+        for rank, ranks in enumerate(chosen):
+            # остаток - следующие по популярности ещё не выбранные ранги
+            candidates = itertools.count()
+            while len(ranks) < counts[rank]:
+                ranks.add(next(candidates))
+
+            movie_id = low + rank * movie_step % movies
+            lines.extend(
+                '{}\t{}\t{}'.format(
+                    movie_id,
+                    second.min + second_rank * second_step % seconds,
+                    tail,
+                )
+                for second_rank in sorted(ranks)
+            )
+
+        return lines
+
+
+PERSON_COLUMNS = (
+    'id', 'full_name', 'birth_date', 'gender', 'created', 'modified',
+)
+GENRE_COLUMNS = ('id', 'name', 'description', 'created', 'modified')
+MOVIE_COLUMNS = (
+    'id', 'title', 'description', 'imdb_identifier', 'creation_date',
+    'file_path', 'rating', 'type_id', 'created', 'modified',
+)
+MOVIE_GENRE_COLUMNS = ('movie_id', 'genre_id', 'created')
+MOVIE_PERSON_ROLE_COLUMNS = (
+    'movie_id', 'person_id', 'person_role_id', 'created',
+)
+
+
+def reserve_ids(cursor, model, count):
+    """Сдвигает последовательность id таблицы на count и возвращает
+    первый зарезервированный id.
+
+    Рассчитано на то, что во время генерации в таблицу больше никто
+    не пишет.
+    """
+    cursor.execute(
+        "SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+        "   nextval(pg_get_serial_sequence(%s, 'id')) + %s - 1) - %s + 1",
+        [_table(model), _table(model), max(count, 1), max(count, 1)]
+    )
+
+    return cursor.fetchone()[0]
+
+
+def copy_lines(cursor, table, columns, lines):
+    """COPY готовых строк в таблицу."""
+    if not lines:
+        return 0
+
+    buffer = io.StringIO('\n'.join(lines) + '\n')
+    cursor.copy_expert(
+        'COPY {} ({}) FROM STDIN'.format(table, ', '.join(columns)),
+        buffer
+    )
+
+    return len(lines)
+
+
+def copy_merge(cursor, model, columns, lines, references=()):
+    """COPY во временную таблицу и перенос в таблицу модели
+    с ON CONFLICT DO NOTHING - как bulk_create(ignore_conflicts=True).
+
+    references - пары (столбец, модель): строки, ссылающиеся на
+    несуществующий id, отбрасываются (id выбираются случайно
+    из интервала и могут попасть в дыру).
+
+    Строки вставляются в порядке столбцов: параллельные процессы берут
+    блокировки уникальных индексов в одном порядке и не попадают во
+    взаимную блокировку.
+
+    Вызывается внутри транзакции: временная таблица удаляется при
+    коммите.
+    """
+    if not lines:
+        return 0
+
+    table = _table(model)
+    cursor.execute(
+        'CREATE TEMP TABLE fake_data_staging ON COMMIT DROP AS '
+        'SELECT {} FROM {} WITH NO DATA'.format(', '.join(columns), table)
+    )
+    copy_lines(cursor, 'fake_data_staging', columns, lines)
+
+    conditions = ' AND '.join(
+        'EXISTS (SELECT 1 FROM {} r WHERE r.id = s.{})'.format(
+            _table(reference), column
+        )
+        for column, reference in references
+    )
+    cursor.execute(
+        'INSERT INTO {table} ({columns}) '
+        'SELECT {columns} FROM fake_data_staging s {where} '
+        'ORDER BY {order} '
+        'ON CONFLICT DO NOTHING'.format(
+            table=table,
+            columns=', '.join(columns),
+            where='WHERE ' + conditions if conditions else '',
+            order=', '.join(str(i + 1) for i in range(len(columns))),
+        )
+    )
+
+    return cursor.rowcount
+
+
+@dataclass
+class CopyJob:
+    """Пачка для отдельного процесса: метод BulkFaker, его аргументы
+    и куда писать результат."""
+    model: str
+    columns: tuple
+    method: str
+    args: tuple
+    seed: int
+    merge: bool = False
+    references: tuple = ()
+
+
+def run_copy_job(job):
+    """Генерирует и пишет одну пачку; возвращает число записанных строк
+    (при merge - без отброшенных конфликтов и ссылок в дыры)."""
+    model = apps.get_model('movies', job.model)
+    lines = getattr(BulkFaker(job.seed), job.method)(*job.args)
+    with transaction.atomic(), connection.cursor() as cursor:
+        if job.merge:
+            return copy_merge(
+                cursor, model, job.columns, lines,
+                [
+                    (column, apps.get_model('movies', reference))
+                    for column, reference in job.references
+                ],
+            )
+
+        return copy_lines(cursor, _table(model), job.columns, lines)
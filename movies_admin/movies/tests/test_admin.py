@@ -0,0 +1,100 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.http import QueryDict
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from movies.models import MoviePersonRole
+from movies.tests.factories.movies_factory import MovieFactory
+from movies.tests.factories.person_factory import PersonFactory
+from movies.tests.factories.person_role_factory import PersonRoleFactory
+
+# сессия, пользователь, фильм, варианты типа и сертификата, по два
+# запроса на инлайн (COUNT и страница), роли, точки сохранения
+MAX_QUERIES = 12
+
+
+class MovieChangeViewTest(TestCase):
+    """Страница фильма в админке: инлайны выводятся страницами, поэтому
+    число запросов и размер ответа не зависят от числа персон фильма,
+    а справочник персон не попадает в страницу целиком."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        role = PersonRoleFactory(name='актёр')
+        persons = PersonFactory.create_batch(500)
+        cls.unlinked = PersonFactory(full_name='Несвязанная Персона')
+
+        cls.small = MovieFactory()
+        cls.large = MovieFactory(type=cls.small.type)
+        MoviePersonRole.objects.bulk_create([
+            MoviePersonRole(movie=movie, person=person, person_role=role)
+            for movie, count in ((cls.small, 60), (cls.large, 500))
+            for person in persons[:count]
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def change(self, movie, **params):
+        return self.client.get(
+            reverse('admin:movies_movie_change', args=[movie.pk]), params
+        )
+
+    def persons_formset(self, response):
+        return next(
+            inline.formset
+            for inline in response.context['inline_admin_formsets']
+            if inline.formset.model is MoviePersonRole
+        )
+
+    def test_inline_is_paginated(self):
+        response = self.change(self.large)
+
+        self.assertEqual(response.status_code, 200)
+        formset = self.persons_formset(response)
+        self.assertEqual(formset.page.paginator.count, 500)
+        self.assertEqual(len(formset.forms), 50)
+
+    def test_query_count_does_not_depend_on_credits(self):
+        # первый запрос заполняет кеш ContentType
+        self.change(self.small)
+        with CaptureQueriesContext(connection) as small:
+            self.change(self.small)
+
+        # строки страницы выбираются вместе с персонами, жанрами и ролями
+        # (select_related), варианты ролей читаются один раз на формсет:
+        # запросов на строку нет
+        self.assertLessEqual(len(small.captured_queries), MAX_QUERIES)
+        with self.assertNumQueries(len(small.captured_queries)):
+            self.change(self.large)
+
+    def test_response_size(self):
+        small = self.change(self.small)
+        large = self.change(self.large)
+
+        # персоны выбираются автодополнением, а не <select> со всеми
+        # строками persons
+        self.assertNotContains(large, self.unlinked.full_name)
+        self.assertLess(len(large.content), len(small.content) * 1.1)
+
+    def test_page_links_keep_other_params(self):
+        response = self.change(self.large, **{
+            'moviepersonrole_set-page': 2,
+            'moviegenre_set-page': 3,
+            '_changelist_filters': 'type__id__exact=1',
+        })
+
+        formset = self.persons_formset(response)
+        self.assertEqual(formset.page.number, 2)
+        for url, page in (
+            (formset.previous_page_url, '1'),
+            (formset.next_page_url, '3'),
+        ):
+            params = QueryDict(url.lstrip('?'))
+            self.assertEqual(params['moviepersonrole_set-page'], page)
+            self.assertEqual(params['moviegenre_set-page'], '3')
+            self.assertEqual(params['_changelist_filters'], 'type__id__exact=1')
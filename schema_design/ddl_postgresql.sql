@@ -42,6 +42,10 @@ CREATE TABLE content.movies (
 );
 
 CREATE UNIQUE INDEX movies_imdb_identifier_uidx ON content.movies (imdb_identifier);
+-- диапазоны imdb id (verify_data, load_data.py --range) сравниваются
+-- побайтно, как в SQLite; индексу выше с правилами сортировки базы
+-- такое сравнение недоступно
+CREATE INDEX movies_imdb_identifier_c_idx ON content.movies (imdb_identifier COLLATE "C");
 
 ALTER TABLE content.movies
     ADD CONSTRAINT fk_movies_certificates
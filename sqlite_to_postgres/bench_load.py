@@ -0,0 +1,554 @@
+"""Бенчмарк загрузки SQLite -> Postgres.
+
+Синтезирует SQLite-базы со схемой db.sqlite нужного размера, загружает
+каждую через load_from_sqlite во временную базу Postgres (создаётся
+и удаляется на каждый прогон) и пишет результаты в JSON, чтобы их можно
+было сравнивать между коммитами:
+
+    python bench_load.py 10k 100k --output bench/$(git rev-parse --short HEAD).json
+    python bench_load.py 10k --compare bench/old.json
+    python bench_load.py 100k --profile cprofile
+
+Подключение к Postgres берётся из тех же переменных DB_*, что
+и у load_data.py; DB_NAME - служебная база, из которой выполняется
+CREATE DATABASE.
+"""
+import argparse
+import cProfile
+import datetime
+import hashlib
+import io
+import json
+import os
+import platform
+import pstats
+import random
+import resource
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from multiprocessing import get_context
+
+import environ
+import psycopg2
+from psycopg2.extensions import connection as _connection
+from psycopg2.extras import DictCursor
+
+from load_data import Checkpoint, LoadStats, SAVERS, load_from_sqlite
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REFERENCE_SQLITE = os.path.join(BASE_DIR, 'db.sqlite')
+SCHEMA_DIR = os.path.join(BASE_DIR, '..', 'schema_design')
+
+SIZES = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+}
+
+# Пропорции db.sqlite на один фильм
+ACTORS_PER_MOVIE = 2.7
+WRITERS_PER_MOVIE = 1.2
+LINKS_PER_MOVIE = 3.5
+
+GENRES = (
+    'Action', 'Adventure', 'Animation', 'Biography', 'Comedy', 'Crime',
+    'Documentary', 'Drama', 'Family', 'Fantasy', 'History', 'Horror',
+    'Music', 'Musical', 'Mystery', 'Romance', 'Sci-Fi', 'Short', 'Sport',
+    'Thriller', 'War', 'Western',
+)
+FIRST_NAMES = (
+    'Mark', 'Harrison', 'Carrie', 'Peter', 'George', 'Irvin', 'Richard',
+    'Lawrence', 'Leigh', 'Anthony', 'Kenny', 'Alec', 'James', 'Billy',
+    'Natalie', 'Ewan', 'Liam', 'Samuel', 'Keira', 'Daisy', 'John', 'Oscar',
+)
+LAST_NAMES = (
+    'Hamill', 'Ford', 'Fisher', 'Cushing', 'Lucas', 'Kershner', 'Marquand',
+    'Kasdan', 'Brackett', 'Daniels', 'Baker', 'Guinness', 'Jones', 'Dee',
+    'Portman', 'McGregor', 'Neeson', 'Jackson', 'Knightley', 'Ridley',
+    'Boyega', 'Isaac',
+)
+WORDS = (
+    'star', 'war', 'empire', 'return', 'force', 'rebel', 'galaxy', 'droid',
+    'jedi', 'hope', 'menace', 'clone', 'revenge', 'dark', 'side', 'planet',
+    'falcon', 'princess', 'master', 'knight', 'storm', 'trooper',
+)
+
+
+def _name(i: int) -> str:
+    """Уникальное имя персоны с номером i."""
+    first = FIRST_NAMES[i % len(FIRST_NAMES)]
+    last = LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    generation = i // (len(FIRST_NAMES) * len(LAST_NAMES))
+    if generation:
+        return '{} {} {}'.format(first, last, generation)
+
+    return '{} {}'.format(first, last)
+
+
+def _writer_id(i: int) -> str:
+    return hashlib.sha1(str(i).encode()).hexdigest()
+
+
+def sqlite_schema(reference: str = REFERENCE_SQLITE) -> list:
+    """CREATE TABLE из эталонной db.sqlite (sqlite_sequence SQLite
+    создаёт сама)."""
+    with sqlite3.connect(reference) as conn:
+        return [
+            row[0] for row in conn.execute(
+                "SELECT sql FROM sqlite_master "
+                "WHERE type = 'table' AND name != 'sqlite_sequence'"
+            )
+        ]
+
+
+def synthesize_sqlite(path: str, movies: int, seed: int = 0,
+                      chunk_size: int = 10_000) -> str:
+    """Создаёт SQLite-базу на movies фильмов со схемой и пропорциями
+    db.sqlite: повторяющиеся имена, 'N/A', сценаристы и в колонке writer,
+    и в JSON-списке writers."""
+    rnd = random.Random(seed)
+    actors = max(int(movies * ACTORS_PER_MOVIE), 1)
+    writers = max(int(movies * WRITERS_PER_MOVIE), 1)
+
+    if os.path.exists(path):
+        os.remove(path)
+
+    conn = sqlite3.connect(path)
+    for sql in sqlite_schema():
+        conn.execute(sql)
+
+    def insert(sql: str, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                conn.executemany(sql, batch)
+                batch = []
+        if batch:
+            conn.executemany(sql, batch)
+
+    insert(
+        "INSERT INTO actors (id, name) VALUES (?, ?)",
+        (
+            (i + 1, 'N/A' if rnd.random() < 0.01 else _name(i))
+            for i in range(actors)
+        )
+    )
+    insert(
+        "INSERT INTO writers (id, name) VALUES (?, ?)",
+        (
+            (_writer_id(i), 'N/A' if rnd.random() < 0.01 else _name(i // 2))
+            for i in range(writers)
+        )
+    )
+
+    def movie_rows():
+        for i in range(movies):
+            writer = writers_json = ''
+            if rnd.random() < 0.4:
+                writer = _writer_id(rnd.randrange(writers))
+            else:
+                writers_json = json.dumps([
+                    {'id': _writer_id(rnd.randrange(writers))}
+                    for _ in range(rnd.randint(1, 4))
+                ])
+
+            director = 'N/A'
+            if rnd.random() > 0.3:
+                director = ', '.join(
+                    _name(rnd.randrange(actors))
+                    for _ in range(rnd.choice((1, 1, 1, 2)))
+                )
+
+            yield (
+                'tt{:07d}'.format(i),
+                ', '.join(rnd.sample(GENRES, rnd.randint(1, 4))),
+                director,
+                writer,
+                ' '.join(rnd.choices(WORDS, k=rnd.randint(1, 5))).title(),
+                'N/A' if rnd.random() < 0.05
+                else ' '.join(rnd.choices(WORDS, k=rnd.randint(20, 60))),
+                None,
+                'N/A' if rnd.random() < 0.01
+                else '{:.1f}'.format(rnd.uniform(1, 10)),
+                writers_json,
+            )
+
+    insert(
+        "INSERT INTO movies "
+        "(id, genre, director, writer, title, plot, ratings, imdb_rating, "
+        "writers) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        movie_rows()
+    )
+
+    links = int(movies * LINKS_PER_MOVIE)
+    insert(
+        "INSERT INTO movie_actors (movie_id, actor_id) VALUES (?, ?)",
+        (
+            (
+                'tt{:07d}'.format(rnd.randrange(movies)),
+                str(rnd.randrange(actors) + 1),
+            )
+            for _ in range(links)
+        )
+    )
+
+    conn.commit()
+    conn.close()
+
+    return path
+
+
+class CountingCursor(DictCursor):
+    """Считает выполненные выражения на соединении (execute_batch
+    и execute_values вызывают execute на каждую страницу)."""
+
+    def execute(self, query, vars=None):
+        self.connection.statements += 1
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        self.connection.statements += 1
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        self.connection.statements += 1
+        return super().copy_expert(sql, file, size)
+
+
+class CountingConnection(_connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements = 0
+
+
+class TimingCheckpoints():
+    """Чекпоинты в памяти, которые заодно засекают время фаз: get()
+    вызывается при старте фазы (resume=True), последний save() - при
+    её завершении."""
+
+    def __init__(self) -> None:
+        self.checkpoints = {}
+        self.phases = {}
+
+    def get(self, phase: str) -> Checkpoint:
+        self.phases[phase] = {'started': time.perf_counter()}
+        return Checkpoint()
+
+    def save(self, phase: str, checkpoint: Checkpoint) -> None:
+        self.checkpoints[phase] = checkpoint
+        if checkpoint.finished:
+            timing = self.phases[phase]
+            seconds = time.perf_counter() - timing.pop('started')
+            timing['rows'] = checkpoint.rows
+            timing['seconds'] = round(seconds, 3)
+            timing['rows_per_second'] = round(
+                checkpoint.rows / seconds if seconds else 0, 1
+            )
+
+    def reset(self) -> None:
+        self.checkpoints.clear()
+        self.phases.clear()
+
+
+@contextmanager
+def throwaway_database(pg_dsn: dict):
+    """Временная база со схемой schema_design; удаляется после прогона."""
+    name = 'bench_load_{}_{}'.format(os.getpid(), int(time.time()))
+    admin = psycopg2.connect(**pg_dsn)
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute('CREATE DATABASE "{}"'.format(name))
+
+    dsn = dict(pg_dsn, dbname=name)
+    try:
+        with psycopg2.connect(**dsn) as conn, conn.cursor() as cur:
+            for filename in ('ddl_postgresql.sql', 'init_data.sql'):
+                with open(os.path.join(SCHEMA_DIR, filename)) as f:
+                    cur.execute(f.read())
+        conn.close()
+
+        yield dsn
+    finally:
+        with admin.cursor() as cur:
+            cur.execute('DROP DATABASE IF EXISTS "{}"'.format(name))
+        admin.close()
+
+
+@contextmanager
+def py_spy(output: str):
+    """py-spy record для текущего процесса на время блока."""
+    executable = shutil.which('py-spy')
+    if executable is None:
+        raise RuntimeError('py-spy is not installed')
+
+    process = subprocess.Popen([
+        executable, 'record', '--pid', str(os.getpid()),
+        '--output', output, '--format', 'speedscope', '--nonblocking',
+    ])
+    try:
+        yield
+    finally:
+        # по SIGINT py-spy дописывает профиль и завершается
+        process.send_signal(signal.SIGINT)
+        process.wait()
+
+
+def _hot_paths(profile: cProfile.Profile, limit: int = 25) -> list:
+    stats = pstats.Stats(profile, stream=io.StringIO())
+    rows = []
+    for (filename, line, function), (_, calls, tottime, cumtime, _) in \
+            stats.stats.items():
+        rows.append({
+            'function': '{}:{}({})'.format(
+                os.path.relpath(filename, BASE_DIR)
+                if filename.startswith(BASE_DIR) else filename,
+                line, function,
+            ),
+            'calls': calls,
+            'tottime': round(tottime, 4),
+            'cumtime': round(cumtime, 4),
+        })
+
+    rows.sort(key=lambda row: row['tottime'], reverse=True)
+    return rows[:limit]
+
+
+def run_case(sqlite_path: str, pg_dsn: dict, mode: str, batch_size: int,
+             profile: str = None, profile_dir: str = None) -> dict:
+    """Один прогон; выполняется в отдельном процессе, чтобы пиковый RSS
+    (ru_maxrss) относился только к нему."""
+    sqlite_statements = 0
+
+    def count_sqlite(statement):
+        nonlocal sqlite_statements
+        sqlite_statements += 1
+
+    result = {}
+    with throwaway_database(pg_dsn) as dsn:
+        sqlite_conn = sqlite3.connect(sqlite_path)
+        sqlite_conn.row_factory = sqlite3.Row
+        sqlite_conn.set_trace_callback(count_sqlite)
+        pg_conn = psycopg2.connect(
+            **dsn,
+            connection_factory=CountingConnection,
+            cursor_factory=CountingCursor,
+        )
+        stats = LoadStats()
+        checkpoints = TimingCheckpoints()
+        profiler = None
+        profile_name = os.path.join(
+            profile_dir or '.',
+            'bench_{}'.format(os.path.basename(sqlite_path).rsplit('.', 1)[0])
+        )
+
+        started = time.perf_counter()
+        try:
+            if profile == 'cprofile':
+                profiler = cProfile.Profile()
+                profiler.enable()
+            spy = nullcontext()
+            if profile == 'py-spy':
+                spy = py_spy(profile_name + '.speedscope.json')
+            with spy:
+                load_from_sqlite(
+                    sqlite_conn, pg_conn, mode=mode, stats=stats,
+                    batch_size=batch_size, checkpoints=checkpoints,
+                    resume=True,
+                )
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            seconds = time.perf_counter() - started
+            pg_conn.close()
+            sqlite_conn.close()
+
+    result['seconds'] = round(seconds, 3)
+    result['phases'] = checkpoints.phases
+    result['stages'] = {
+        name: dict(
+            stage,
+            seconds=round(stage['seconds'], 3),
+            rows_per_second=round(
+                stage['rows'] / stage['seconds'] if stage['seconds'] else 0,
+                1,
+            ),
+        )
+        for name, stage in stats.stages.items()
+    }
+    result['statements'] = {
+        'postgres': pg_conn.statements,
+        'sqlite': sqlite_statements,
+    }
+    # на Linux ru_maxrss в килобайтах, на macOS - в байтах
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        maxrss *= 1024
+    result['peak_rss_mb'] = round(maxrss / 2 ** 20, 1)
+
+    if profiler is not None:
+        profiler.dump_stats(profile_name + '.prof')
+        result['hot_paths'] = _hot_paths(profiler)
+
+    return result
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR,
+            stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous: dict, current: dict) -> str:
+    """Изменение общего времени и rows/s фаз относительно прошлых
+    результатов."""
+    lines = []
+    for size, case in current['cases'].items():
+        old = previous.get('cases', {}).get(size)
+        if old is None:
+            continue
+        lines.append('%s: %.2f s -> %.2f s (%+.1f%%)' % (
+            size, old['seconds'], case['seconds'],
+            100.0 * (case['seconds'] - old['seconds']) / old['seconds'],
+        ))
+        for phase, timing in case['phases'].items():
+            old_timing = old['phases'].get(phase)
+            if not old_timing or not old_timing['rows_per_second']:
+                continue
+            lines.append('  %-18s %10.0f -> %10.0f rows/s (%+.1f%%)' % (
+                phase, old_timing['rows_per_second'],
+                timing['rows_per_second'],
+                100.0 * (
+                    timing['rows_per_second'] - old_timing['rows_per_second']
+                ) / old_timing['rows_per_second'],
+            ))
+
+    return '\n'.join(lines)
+
+
+def report(case: dict) -> str:
+    lines = ['  total %.2f s, peak RSS %.1f MB, statements: %s' % (
+        case['seconds'], case['peak_rss_mb'],
+        ', '.join('%s %d' % item for item in case['statements'].items()),
+    )]
+    for phase, timing in case['phases'].items():
+        lines.append('  %-18s %10d rows %8.2f s %10.0f rows/s' % (
+            phase, timing['rows'], timing['seconds'],
+            timing['rows_per_second'],
+        ))
+
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the SQLite -> Postgres loader '
+        'on synthetic databases'
+    )
+    parser.add_argument(
+        'sizes',
+        nargs='*',
+        choices=SIZES.keys(),
+        default=['10k'],
+        help='Source sizes in movies (default: 10k)',
+    )
+    parser.add_argument(
+        '--mode',
+        choices=SAVERS.keys(),
+        default='copy',
+        help='Saver used by load_from_sqlite',
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=500,
+        help='The number of SQLite rows in one batch',
+    )
+    parser.add_argument(
+        '--data-dir',
+        default=os.path.join(tempfile.gettempdir(), 'bench_load'),
+        help='Where synthetic SQLite databases are kept between runs',
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='Random seed of the synthetic data',
+    )
+    parser.add_argument(
+        '--profile',
+        choices=('cprofile', 'py-spy'),
+        help='Dump hot paths: a .prof file and the top functions in the '
+        'results (cprofile) or a speedscope profile (py-spy)',
+    )
+    parser.add_argument(
+        '--output',
+        default='bench_results.json',
+        help='JSON file with the results',
+    )
+    parser.add_argument(
+        '--compare',
+        help='Previous results JSON to compare against',
+    )
+    args = parser.parse_args()
+
+    env = environ.Env()
+    env.read_env(env.str('ENV_PATH', '.env'))
+
+    pg_dsn = {
+        'dbname': env('DB_NAME'),
+        'user': env('DB_USER'),
+        'password': env('DB_PASSWORD'),
+        'host': env('DB_HOST'),
+        'port': env('DB_PORT'),
+    }
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = {
+        'revision': _git_revision(),
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'mode': args.mode,
+        'batch_size': args.batch_size,
+        'seed': args.seed,
+        'cases': {},
+    }
+
+    for size in args.sizes:
+        sqlite_path = os.path.join(
+            args.data_dir, '{}_seed{}.sqlite'.format(size, args.seed)
+        )
+        if not os.path.exists(sqlite_path):
+            print('synthesizing %s ...' % sqlite_path, file=sys.stderr)
+            synthesize_sqlite(sqlite_path, SIZES[size], seed=args.seed)
+
+        # отдельный процесс на каждый размер - честный пиковый RSS
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=get_context('spawn')
+        ) as executor:
+            case = executor.submit(
+                run_case, sqlite_path, pg_dsn, args.mode, args.batch_size,
+                args.profile, os.path.dirname(os.path.abspath(args.output)),
+            ).result()
+
+        results['cases'][size] = case
+        print(size)
+        print(report(case))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(json.load(f), results))
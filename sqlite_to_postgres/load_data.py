@@ -1,4 +1,14 @@
+import argparse
 import dataclasses
+import datetime
+import io
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from dataclasses import dataclass, field
 
 import environ
@@ -6,7 +16,7 @@ import json
 import sqlite3
 import psycopg2
 from psycopg2.extensions import connection as _connection
-from psycopg2.extras import DictCursor, execute_batch
+from psycopg2.extras import DictCursor, execute_batch, execute_values
 
 
 @dataclass(frozen=True)
@@ -38,20 +48,312 @@ class Movie:
     actors: list[Actor] = field(default_factory=list)
 
 
-class PostgresSaver():
+@dataclass
+class Batch:
+    """Пачка, прочитанная из SQLite: ключ последней прочитанной строки
+    (для keyset-продолжения и чекпоинта), количество прочитанных строк
+    исходной таблицы и данные для записи. В persons и genres попадают
+    только имена, которые ещё не встречались в потоке."""
+    last_key: object
+    rows: int
+    persons: list = field(default_factory=list)
+    genres: list = field(default_factory=list)
+    movies: list[Movie] = field(default_factory=list)
+
+
+class LoadStats():
+    """Время и количество строк по этапам загрузки (для сравнения
+    режимов insert и copy)."""
+
+    def __init__(self) -> None:
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, rows: int):
+        started = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - started
+
+        with self._lock:
+            stage = self.stages.setdefault(name, {'rows': 0, 'seconds': 0.0})
+            stage['rows'] += rows
+            stage['seconds'] += seconds
+
+    def report(self) -> str:
+        lines = []
+        for name, stage in self.stages.items():
+            rate = stage['rows'] / stage['seconds'] if stage['seconds'] else 0
+            lines.append(
+                "%-14s %10d rows %8.2f s %10.0f rows/s" % (
+                    name, stage['rows'], stage['seconds'], rate
+                )
+            )
+
+        return '\n'.join(lines)
+
+
+@dataclass
+class Checkpoint:
+    last_key: object = None
+    rows: int = 0
+    finished: bool = False
+
+
+class CheckpointStore():
+    """Чекпоинты загрузки в content.load_checkpoints: для каждой фазы
+    ключ последней записанной строки SQLite и число прочитанных строк.
+
+    Ключ хранится в JSON, чтобы при возобновлении сохранить его тип
+    (id актёров целые, фильмов и сценаристов - строки). Чекпоинт
+    коммитится после пачки, а не вместе с ней; повторная запись одной
+    пачки после сбоя безопасна, так как все вставки идут
+    с ON CONFLICT DO NOTHING.
+    """
+
     def __init__(self, conn: _connection) -> None:
         self.pg_connection = conn
+        self._lock = threading.Lock()
+
+        with self._lock, conn.cursor() as cur:
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS content.load_checkpoints ("
+                "   phase text PRIMARY KEY, "
+                "   last_key text, "
+                "   rows bigint NOT NULL DEFAULT 0, "
+                "   finished boolean NOT NULL DEFAULT false, "
+                "   updated_at timestamp with time zone NOT NULL DEFAULT now()"
+                ")"
+            )
+            conn.commit()
+
+    def get(self, phase: str) -> Checkpoint:
+        with self._lock, self.pg_connection.cursor() as cur:
+            cur.execute(
+                "SELECT last_key, rows, finished "
+                "FROM content.load_checkpoints WHERE phase = %s",
+                (phase,)
+            )
+            row = cur.fetchone()
+            self.pg_connection.commit()
+
+        if row is None:
+            return Checkpoint()
+
+        last_key = json.loads(row[0]) if row[0] is not None else None
+        return Checkpoint(last_key, row[1], row[2])
+
+    def save(self, phase: str, checkpoint: Checkpoint) -> None:
+        with self._lock, self.pg_connection.cursor() as cur:
+            cur.execute(
+                "INSERT INTO content.load_checkpoints "
+                "   (phase, last_key, rows, finished, updated_at) "
+                "   VALUES (%s, %s, %s, %s, now()) "
+                "   ON CONFLICT (phase) DO UPDATE SET "
+                "       last_key = EXCLUDED.last_key, "
+                "       rows = EXCLUDED.rows, "
+                "       finished = EXCLUDED.finished, "
+                "       updated_at = EXCLUDED.updated_at",
+                (
+                    phase, json.dumps(checkpoint.last_key),
+                    checkpoint.rows, checkpoint.finished,
+                )
+            )
+            self.pg_connection.commit()
+
+    def reset(self) -> None:
+        with self._lock, self.pg_connection.cursor() as cur:
+            cur.execute("DELETE FROM content.load_checkpoints")
+            self.pg_connection.commit()
+
+
+class Progress():
+    """Периодический вывод хода фазы: строки, rows/s и ETA."""
+
+    def __init__(self, phase: str, total: int, rows: int = 0,
+                 interval: float = 5.0) -> None:
+        self.phase = phase
+        self.total = total
+        self.rows = rows
+        self.interval = interval
+        # скорость считается только по строкам этого запуска
+        self._initial = rows
+        self._started = self._reported = time.monotonic()
+
+    def update(self, rows: int) -> None:
+        self.rows = rows
+        now = time.monotonic()
+        if now - self._reported >= self.interval:
+            self._reported = now
+            self.report(now)
+
+    def report(self, now: float = None) -> None:
+        elapsed = (now or time.monotonic()) - self._started
+        rate = (self.rows - self._initial) / elapsed if elapsed else 0
+
+        eta = '-'
+        if rate:
+            left = max(self.total - self.rows, 0) / rate
+            eta = str(datetime.timedelta(seconds=int(left)))
+
+        percent = 100.0 * self.rows / self.total if self.total else 100.0
+        print(
+            "%-18s %10d/%-10d %5.1f%% %10.0f rows/s ETA %s" % (
+                self.phase, self.rows, self.total, percent, rate, eta
+            ),
+            file=sys.stderr,
+            flush=True,
+        )
 
-    def save_persons_data(self, persons: list):
-        cur = self.pg_connection.cursor()
 
-        execute_batch(
+class PhaseCheckpoint():
+    """Ход одной фазы загрузки.
+
+    Пачки нумеруются в порядке чтения. Чекпоинт продвигается только по
+    непрерывному префиксу записанных пачек: несколько писателей
+    завершают пачки не по порядку, и ключ пачки n + 1 нельзя сохранить,
+    пока не записана пачка n.
+    """
+
+    def __init__(self, phase: str, store: CheckpointStore = None,
+                 progress: Progress = None, resume: bool = False) -> None:
+        self.phase = phase
+        self.store = store
+        self.progress = progress
+        self.state = Checkpoint()
+        if store is not None and resume:
+            self.state = store.get(phase)
+
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._done = set()
+        self._read = 0
+        self._next = 0
+
+    @property
+    def last_key(self):
+        return self.state.last_key
+
+    @property
+    def finished(self) -> bool:
+        return self.state.finished
+
+    def read(self, batch: Batch) -> int:
+        """Регистрирует прочитанную пачку и возвращает её номер."""
+        with self._lock:
+            seq = self._read
+            self._pending[seq] = (batch.last_key, batch.rows)
+            self._read += 1
+
+        return seq
+
+    def done(self, seq: int) -> None:
+        with self._lock:
+            self._done.add(seq)
+            advanced = False
+            while self._next in self._done:
+                self._done.remove(self._next)
+                last_key, rows = self._pending.pop(self._next)
+                self.state.last_key = last_key
+                self.state.rows += rows
+                self._next += 1
+                advanced = True
+
+            if not advanced:
+                return
+            if self.store is not None:
+                self.store.save(self.phase, self.state)
+            if self.progress is not None:
+                self.progress.update(self.state.rows)
+
+    def finish(self) -> None:
+        self.state.finished = True
+        if self.store is not None:
+            self.store.save(self.phase, self.state)
+        if self.progress is not None:
+            self.progress.report()
+
+
+class PostgresSaver():
+    """Запись пачек в Postgres.
+
+    Строки каждой пачки вставляются в порядке ключа: параллельные
+    загрузчики (--workers) тогда берут блокировки уникальных индексов
+    в одном порядке и не попадают во взаимную блокировку.
+    """
+
+    def __init__(self, conn: _connection, stats: LoadStats = None) -> None:
+        self.pg_connection = conn
+        self.stats = stats or LoadStats()
+        # справочники жанров и ролей малы, поэтому кешируются на всю загрузку
+        self._genre_ids = {}
+        self._role_ids = {}
+
+    def _fetch_ids(self, cur, sql: str, keys) -> dict:
+        """{ключ: id} одним запросом с = ANY(массив) вместо длинного IN."""
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        cur.execute(sql, (keys,))
+        return {row[1]: row[0] for row in cur.fetchall()}
+
+    def _get_movie_ids(self, cur, imdb_identifiers) -> dict:
+        return self._fetch_ids(
+            cur,
+            "SELECT id, imdb_identifier FROM content.movies "
+            "WHERE imdb_identifier = ANY(%s)",
+            imdb_identifiers
+        )
+
+    def _get_person_ids(self, cur, names) -> dict:
+        return self._fetch_ids(
             cur,
-            "INSERT INTO content.persons (full_name) VALUES (%s) "
-            "ON CONFLICT (full_name) DO NOTHING",
-            [(person_name,) for person_name in persons]
+            "SELECT id, full_name FROM content.persons "
+            "WHERE full_name = ANY(%s)",
+            names
         )
 
+    def _get_genre_ids(self, cur, names) -> dict:
+        missing = set(names) - self._genre_ids.keys()
+        self._genre_ids.update(self._fetch_ids(
+            cur,
+            "SELECT id, name FROM content.genres WHERE name = ANY(%s)",
+            missing
+        ))
+
+        return self._genre_ids
+
+    @staticmethod
+    def _movie_persons(movies: list[Movie]) -> list:
+        """Связи пачки в виде (imdb_identifier, имя персоны, роль)."""
+        result = []
+        for m in movies:
+            result += [(m.imdb_identifier, a.name, 'актёр') for a in m.actors]
+            result += [(m.imdb_identifier, w.name, 'сценарист')
+                       for w in m.writers]
+            result += [(m.imdb_identifier, d, 'режисёр') for d in m.directors]
+
+        return result
+
+    def _get_role_ids(self, cur) -> dict:
+        if not self._role_ids:
+            cur.execute("SELECT id, name FROM content.person_roles")
+            self._role_ids = {row[1]: row[0] for row in cur.fetchall()}
+
+        return self._role_ids
+
+    def save_persons_data(self, persons: list):
+        cur = self.pg_connection.cursor()
+
+        with self.stats.stage('persons', len(persons)):
+            execute_batch(
+                cur,
+                "INSERT INTO content.persons (full_name) VALUES (%s) "
+                "ON CONFLICT (full_name) DO NOTHING",
+                [(person_name,) for person_name in sorted(set(persons))]
+            )
+
         self.pg_connection.commit()
         cur.close()
 
@@ -60,12 +362,13 @@ class PostgresSaver():
     def save_genres_data(self, genres: list):
         cur = self.pg_connection.cursor()
 
-        execute_batch(
-            cur,
-            "INSERT INTO content.genres (name) VALUES (%s) "
-            "ON CONFLICT (name) DO NOTHING",
-            [(genre_name,) for genre_name in genres]
-        )
+        with self.stats.stage('genres', len(genres)):
+            execute_batch(
+                cur,
+                "INSERT INTO content.genres (name) VALUES (%s) "
+                "ON CONFLICT (name) DO NOTHING",
+                [(genre_name,) for genre_name in sorted(set(genres))]
+            )
 
         self.pg_connection.commit()
         cur.close()
@@ -86,316 +389,848 @@ class PostgresSaver():
             )
 
         # Создаём Фильмы
-        execute_batch(
-            cur,
-            "INSERT INTO content.movies "
-            "   ("
-            "       title, type_id, imdb_identifier, "
-            "       imdb_rating, description"
-            "   )"
-            "   VALUES (%s, %s, %s, %s, %s) "
-            "   ON CONFLICT (imdb_identifier) DO NOTHING",
-            [
-                (
-                    m.title,
-                    movie_type[0],
-                    m.imdb_identifier,
-                    m.imdb_rating,
-                    m.description
-                ) for m in movies
-            ],
-        )
+        with self.stats.stage('movies', len(movies)):
+            execute_batch(
+                cur,
+                "INSERT INTO content.movies "
+                "   ("
+                "       title, type_id, imdb_identifier, "
+                "       imdb_rating, description"
+                "   )"
+                "   VALUES (%s, %s, %s, %s, %s) "
+                "   ON CONFLICT (imdb_identifier) DO NOTHING",
+                [
+                    (
+                        m.title,
+                        movie_type[0],
+                        m.imdb_identifier,
+                        m.imdb_rating,
+                        m.description
+                    ) for m in sorted(movies, key=lambda m: m.imdb_identifier)
+                ],
+            )
 
         self.pg_connection.commit()
 
         # Связываем Фильмы и Жанры
-        genre_movie = {}
-        for movie in movies:
-            for genre in movie.genres:
-                genre_movie.setdefault(genre, []).append(movie.imdb_identifier)
-
-        execute_batch(
-            cur,
-            "INSERT INTO content.genre_movie (movie_id, genre_id)"
-            "       SELECT m.id, g.id"
-            "           FROM movies m LEFT JOIN "
-            "               (SELECT id FROM genres WHERE name=%s) g ON 1=1"
-            "           WHERE m.imdb_identifier IN %s"
-            "   ON CONFLICT (movie_id, genre_id) DO NOTHING",
-            [
-                (
-                    genre,
-                    tuple(genre_movie[genre])
-                ) for genre in genre_movie.keys()
-            ]
+        movie_ids = self._get_movie_ids(
+            cur, [m.imdb_identifier for m in movies]
+        )
+        genre_ids = self._get_genre_ids(
+            cur, {genre for m in movies for genre in m.genres}
         )
 
+        genre_links = {
+            (movie_ids[m.imdb_identifier], genre_ids[genre])
+            for m in movies if m.imdb_identifier in movie_ids
+            for genre in m.genres if genre in genre_ids
+        }
+        with self.stats.stage('movie_genres', len(genre_links)):
+            execute_values(
+                cur,
+                "INSERT INTO content.genre_movie (movie_id, genre_id) "
+                "VALUES %s ON CONFLICT (movie_id, genre_id) DO NOTHING",
+                sorted(genre_links),
+                page_size=1000
+            )
+
         self.pg_connection.commit()
 
         # Связываем Фильмы и Персоны (актёров, режисёров, сценаристов)
-        movie_person_role = {}
-        for movie in movies:
-            movie_person_role.setdefault(
-                movie.imdb_identifier, {}
-            ).setdefault('actors', ['stumb'])
-            movie_person_role.setdefault(
-                movie.imdb_identifier, {}
-            ).setdefault('directors', ['stumb'])
-            movie_person_role.setdefault(
-                movie.imdb_identifier, {}
-            ).setdefault('writers', ['stumb'])
-            for actor in movie.actors:
-                movie_person_role[movie.imdb_identifier]['actors'].append(
-                    actor.name
-                )
-            for director in movie.directors:
-                movie_person_role[movie.imdb_identifier]['directors'].append(
-                    director
-                )
-            for writer in movie.writers:
-                movie_person_role[movie.imdb_identifier]['writers'].append(
-                    writer.name
-                )
+        role_ids = self._get_role_ids(cur)
+        movie_persons = self._movie_persons(movies)
 
-        execute_batch(
-            cur,
-            "INSERT INTO content.movie_person_role"
-            "   (movie_id, person_id, person_role_id)"
-            "       SELECT m.id, p.id, pr.id"
-            "           FROM content.movies m"
-            "               INNER JOIN ("
-            "                   SELECT id"
-            "                       FROM content.persons"
-            "                       WHERE full_name IN %s"
-            "               ) p ON 1=1"
-            "               INNER JOIN ("
-            "                   SELECT id"
-            "                       FROM content.person_roles"
-            "                       WHERE name = 'актёр'"
-            "               ) pr ON 1=1"
-            "           WHERE m.imdb_identifier=%s"
-            "       UNION ALL"
-            "       SELECT m.id, p.id, pr.id"
-            "           FROM content.movies m"
-            "               INNER JOIN ("
-            "                   SELECT id"
-            "                       FROM content.persons"
-            "                       WHERE full_name IN %s"
-            "               ) p ON 1=1"
-            "               INNER JOIN ("
-            "                   SELECT id"
-            "                       FROM content.person_roles"
-            "                       WHERE name = 'сценарист'"
-            "               ) pr ON 1=1"
-            "           WHERE m.imdb_identifier=%s"
-            "       UNION ALL"
-            "       SELECT m.id, p.id, pr.id"
-            "           FROM content.movies m"
-            "               INNER JOIN ("
-            "                   SELECT id"
-            "                       FROM content.persons"
-            "                       WHERE full_name IN %s"
-            "                   ) p ON 1=1"
-            "               INNER JOIN ("
-            "                   SELECT id"
-            "                       FROM content.person_roles"
-            "                       WHERE name = 'режисёр'"
-            "                   ) pr ON 1=1"
-            "           WHERE m.imdb_identifier=%s"
-            "   ON CONFLICT (movie_id, person_id, person_role_id) DO NOTHING",
-            [
-                (
-                    tuple(movie_person_role[imdb_key]['actors']),  imdb_key,
-                    tuple(movie_person_role[imdb_key]['writers']),  imdb_key,
-                    tuple(movie_person_role[imdb_key]['directors']),  imdb_key,
-                ) for imdb_key in movie_person_role
-            ]
+        person_ids = self._get_person_ids(
+            cur, {name for _, name, _ in movie_persons}
         )
 
+        person_links = {
+            (movie_ids[imdb], person_ids[name], role_ids[role])
+            for imdb, name, role in movie_persons
+            if imdb in movie_ids and name in person_ids and role in role_ids
+        }
+        with self.stats.stage('movie_persons', len(person_links)):
+            execute_values(
+                cur,
+                "INSERT INTO content.movie_person_role "
+                "(movie_id, person_id, person_role_id) "
+                "VALUES %s "
+                "ON CONFLICT (movie_id, person_id, person_role_id) DO NOTHING",
+                sorted(person_links),
+                page_size=1000
+            )
+
         self.pg_connection.commit()
         cur.close()
 
         return True
 
+    def save_references(self, batch: Batch):
+        """Новые персоны и жанры пачки."""
+        if batch.persons:
+            self.save_persons_data(batch.persons)
+        if batch.genres:
+            self.save_genres_data(batch.genres)
 
-class SQLiteLoader():
-    def __init__(self, conn: sqlite3.Connection) -> None:
-        self.sqlite_connection = conn
+        return True
 
-    def _get_movies(self, start: int, limit: int):
-        sql = f"SELECT * FROM movies LIMIT {start}, {limit}"
-        return self.sqlite_connection.execute(sql).fetchall()
+    def save_movies(self, batch: Batch):
+        if batch.movies:
+            self.save_movies_data(batch.movies)
 
-    def _get_movie_writers(self, writer: str, writers: str) -> list:
-        unique_data = {}
-        if writer:
-            unique_data.setdefault(writer, None)
+        return True
 
-        if writers:
-            writers = json.loads(writers)
-            for w in writers:
-                unique_data.setdefault(w["id"], None)
+    def delete_movie_range(self, after, last) -> int:
+        """Удаляет фильмы с imdb id в (after, last] вместе со связями.
+
+        Ключи сравниваются побайтно (COLLATE "C"), как в SQLite и в
+        диапазонах verify_data; такое сравнение обслуживает индекс
+        movies_imdb_identifier_c_idx (schema_design/ddl_postgresql.sql).
+        """
+        conditions, params = [], []
+        if after is not None:
+            conditions.append('imdb_identifier COLLATE "C" > %s')
+            params.append(after)
+        if last is not None:
+            conditions.append('imdb_identifier COLLATE "C" <= %s')
+            params.append(last)
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+        with self.pg_connection.cursor() as cur:
+            cur.execute(
+                "CREATE TEMP TABLE reload_movies ON COMMIT DROP AS "
+                "SELECT id FROM content.movies" + where, params
+            )
+            for table in ('genre_movie', 'movie_person_role'):
+                cur.execute(
+                    "DELETE FROM content.{} WHERE movie_id IN "
+                    "(SELECT id FROM reload_movies)".format(table)
+                )
+            cur.execute(
+                "DELETE FROM content.movies WHERE id IN "
+                "(SELECT id FROM reload_movies)"
+            )
+            deleted = cur.rowcount
+        self.pg_connection.commit()
 
-        in_placeholders = ','.join(['?'] * len(unique_data))
+        return deleted
 
-        rows = self.sqlite_connection.execute(
-            f"SELECT id, name FROM writers "
-            f"WHERE id IN ({in_placeholders}) AND name != 'N/A'",
-            list(unique_data.keys())
-        ).fetchall()
 
-        result = []
+def _copy_value(value) -> str:
+    """Значение в текстовом формате COPY."""
+    if value is None:
+        return '\\N'
+
+    return str(value).replace(
+        '\\', '\\\\'
+    ).replace(
+        '\t', '\\t'
+    ).replace(
+        '\n', '\\n'
+    ).replace(
+        '\r', '\\r'
+    )
+
+
+class PostgresCopySaver(PostgresSaver):
+    """Загрузка через COPY: пачка потоком уходит во временную таблицу
+    (временные таблицы не пишутся в WAL), затем сливается в content.*
+    одним INSERT ... SELECT ... ON CONFLICT DO NOTHING на таблицу."""
+
+    STAGING_TABLES = (
+        "CREATE TEMP TABLE IF NOT EXISTS staging_persons ("
+        "   full_name TEXT"
+        ") ON COMMIT DELETE ROWS",
+        "CREATE TEMP TABLE IF NOT EXISTS staging_genres ("
+        "   name TEXT"
+        ") ON COMMIT DELETE ROWS",
+        "CREATE TEMP TABLE IF NOT EXISTS staging_movies ("
+        "   imdb_identifier TEXT, title TEXT,"
+        "   imdb_rating NUMERIC, description TEXT"
+        ") ON COMMIT DELETE ROWS",
+        "CREATE TEMP TABLE IF NOT EXISTS staging_movie_genres ("
+        "   imdb_identifier TEXT, genre TEXT"
+        ") ON COMMIT DELETE ROWS",
+        "CREATE TEMP TABLE IF NOT EXISTS staging_movie_persons ("
+        "   imdb_identifier TEXT, full_name TEXT, role TEXT"
+        ") ON COMMIT DELETE ROWS",
+    )
+
+    def __init__(self, conn: _connection, stats: LoadStats = None) -> None:
+        super().__init__(conn, stats)
+
+        cur = self.pg_connection.cursor()
+        for sql in self.STAGING_TABLES:
+            cur.execute(sql)
+        self.pg_connection.commit()
+        cur.close()
+
+    def _copy(self, cur, table: str, columns: tuple, rows) -> None:
+        buffer = io.StringIO()
         for row in rows:
-            result.append(Writer(row["id"], row["name"]))
+            buffer.write('\t'.join(_copy_value(v) for v in row))
+            buffer.write('\n')
+        buffer.seek(0)
 
-        return result
+        cur.copy_expert(
+            "COPY {} ({}) FROM STDIN".format(table, ', '.join(columns)),
+            buffer
+        )
 
-    def _get_movie_actors(self, movie_id: str):
-        rows = self.sqlite_connection.execute(
-            ''.join(
+    def save_persons_data(self, persons: list):
+        cur = self.pg_connection.cursor()
+
+        with self.stats.stage('persons', len(persons)):
+            self._copy(
+                cur, 'staging_persons', ('full_name',),
+                ((name,) for name in persons)
+            )
+            cur.execute(
+                "INSERT INTO content.persons (full_name) "
+                "   SELECT DISTINCT full_name FROM staging_persons "
+                "   ORDER BY full_name "
+                "   ON CONFLICT (full_name) DO NOTHING"
+            )
+            self.pg_connection.commit()
+
+        cur.close()
+
+        return True
+
+    def save_genres_data(self, genres: list):
+        cur = self.pg_connection.cursor()
+
+        with self.stats.stage('genres', len(genres)):
+            self._copy(
+                cur, 'staging_genres', ('name',),
+                ((name,) for name in genres)
+            )
+            cur.execute(
+                "INSERT INTO content.genres (name) "
+                "   SELECT DISTINCT name FROM staging_genres "
+                "   ORDER BY name "
+                "   ON CONFLICT (name) DO NOTHING"
+            )
+            self.pg_connection.commit()
+
+        cur.close()
+
+        return True
+
+    def save_movies_data(self, movies: list[Movie]):
+        cur = self.pg_connection.cursor()
+
+        cur.execute(
+            "SELECT id FROM content.movie_types WHERE name=%s", ('фильм',)
+        )
+        movie_type = cur.fetchone()
+
+        if not movie_type:
+            raise psycopg2.DataError(
+                "There is no movie_type with name 'фильм'"
+            )
+
+        # Создаём Фильмы
+        with self.stats.stage('movies', len(movies)):
+            self._copy(
+                cur, 'staging_movies',
+                ('imdb_identifier', 'title', 'imdb_rating', 'description'),
                 (
-                    "SELECT a.id, a.name ",
-                    "FROM actors a ",
-                    "LEFT JOIN movie_actors ms ON a.id=ms.actor_id ",
-                    "WHERE ms.movie_id = ? AND a.name != 'N/A'",
+                    (m.imdb_identifier, m.title, m.imdb_rating, m.description)
+                    for m in movies
                 )
-            ),
-            (movie_id,)
-        ).fetchall()
+            )
+            cur.execute(
+                "INSERT INTO content.movies "
+                "   (title, type_id, imdb_identifier, imdb_rating, description)"
+                "   SELECT DISTINCT ON (imdb_identifier)"
+                "       title, %s, imdb_identifier, imdb_rating, description"
+                "   FROM staging_movies"
+                "   ORDER BY imdb_identifier"
+                "   ON CONFLICT (imdb_identifier) DO NOTHING",
+                (movie_type[0],)
+            )
+
+        # Связываем Фильмы и Жанры
+        genre_links = [
+            (m.imdb_identifier, genre) for m in movies for genre in m.genres
+        ]
+        with self.stats.stage('movie_genres', len(genre_links)):
+            self._copy(
+                cur, 'staging_movie_genres', ('imdb_identifier', 'genre'),
+                genre_links
+            )
+            cur.execute(
+                "INSERT INTO content.genre_movie (movie_id, genre_id)"
+                "   SELECT DISTINCT m.id, g.id"
+                "   FROM staging_movie_genres s"
+                "       JOIN content.movies m"
+                "           ON m.imdb_identifier = s.imdb_identifier"
+                "       JOIN content.genres g ON g.name = s.genre"
+                "   ORDER BY 1, 2"
+                "   ON CONFLICT (movie_id, genre_id) DO NOTHING"
+            )
+
+        # Связываем Фильмы и Персоны (актёров, режисёров, сценаристов)
+        person_links = self._movie_persons(movies)
+
+        with self.stats.stage('movie_persons', len(person_links)):
+            self._copy(
+                cur, 'staging_movie_persons',
+                ('imdb_identifier', 'full_name', 'role'),
+                person_links
+            )
+            cur.execute(
+                "INSERT INTO content.movie_person_role"
+                "   (movie_id, person_id, person_role_id)"
+                "   SELECT DISTINCT m.id, p.id, pr.id"
+                "   FROM staging_movie_persons s"
+                "       JOIN content.movies m"
+                "           ON m.imdb_identifier = s.imdb_identifier"
+                "       JOIN content.persons p ON p.full_name = s.full_name"
+                "       JOIN content.person_roles pr ON pr.name = s.role"
+                "   ORDER BY 1, 2, 3"
+                "   ON CONFLICT (movie_id, person_id, person_role_id) DO NOTHING"
+            )
+
+        self.pg_connection.commit()
+        cur.close()
+
+        return True
 
+
+class SQLiteLoader():
+    """Потоковое чтение SQLite.
+
+    Каждая таблица читается одним запросом в порядке id, строки
+    забираются через fetchmany по limit штук, и пачки отдаются
+    генератором: в памяти одновременно только текущая пачка и множества
+    уже встреченных имён персон и жанров.
+    """
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.sqlite_connection = conn
+        self._seen_persons = set()
+        self._seen_genres = set()
+
+    def _iter_rows(self, sql: str, after, limit: int, key: str = 'id',
+                   last=None):
+        """Строки запроса пачками по limit, с ключом key в (after, last].
+
+        sql - SELECT без WHERE/ORDER BY; условие и сортировка по key
+        добавляются здесь. Keyset-условие вместо LIMIT offset позволяет
+        продолжить чтение с ключа из чекпоинта.
+        """
+        conditions, params = [], []
+        if after is not None:
+            conditions.append(f"{key} > ?")
+            params.append(after)
+        if last is not None:
+            conditions.append(f"{key} <= ?")
+            params.append(last)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+
+        cursor = self.sqlite_connection.execute(
+            f"{sql}{where} ORDER BY {key}", params
+        )
+
+        try:
+            while True:
+                rows = cursor.fetchmany(limit)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    def _new_names(self, names, seen: set) -> list:
+        """Имена, которых ещё не было в потоке, без повторов."""
         result = []
-        for row in rows:
-            result.append(Actor(row["id"], row["name"]))
+        for name in names:
+            if name not in seen:
+                seen.add(name)
+                result.append(name)
 
         return result
 
+    def _iter_movie_actors(self, after, limit: int, last=None):
+        """Пары (movie_id, Actor) в порядке movie_id.
+
+        Индекса по movie_actors.movie_id нет, и выборка по списку фильмов
+        на каждую пачку просматривала бы всю таблицу заново. Вместо этого
+        она читается один раз, отсортированной, и сливается с потоком
+        фильмов в iter_movies.
+        """
+        for rows in self._iter_rows(
+            "SELECT * FROM ("
+            "   SELECT ma.movie_id, a.id, a.name "
+            "   FROM movie_actors ma "
+            "   JOIN actors a ON a.id = ma.actor_id "
+            "   WHERE a.name != 'N/A'"
+            ")",
+            after, limit, key='movie_id', last=last,
+        ):
+            for row in rows:
+                yield row["movie_id"], Actor(row["id"], row["name"])
+
+    def _writer_ids(self, row) -> list:
+        """id сценаристов фильма из колонки writer и JSON-списка writers."""
+        ids = []
+        if row["writer"]:
+            ids.append(row["writer"])
+        if row["writers"]:
+            ids += [writer["id"] for writer in json.loads(row["writers"])]
+
+        return list(dict.fromkeys(ids))
+
+    def _get_writers(self, writer_ids: set) -> dict:
+        """Сценаристы пачки одним запросом по первичному ключу.
+
+        Список id передаётся одним JSON-параметром, чтобы не упираться
+        в лимит переменных SQLite.
+        """
+        rows = self.sqlite_connection.execute(
+            "SELECT id, name FROM writers "
+            "WHERE id IN (SELECT value FROM json_each(?)) "
+            "AND name != 'N/A'",
+            (json.dumps(list(writer_ids)),)
+        ).fetchall()
+
+        return {row["id"]: Writer(row["id"], row["name"]) for row in rows}
+
     def _check_na(self, string: str) -> bool:
         if string and string == 'N/A':
             return True
 
         return False
 
-    def load_movies(self, start: int, limit: int) -> list:
-        sqlite_movies = self._get_movies(start, limit)
+    def count(self, table: str) -> int:
+        return self.sqlite_connection.execute(
+            f"SELECT COUNT(*) FROM {table}"
+        ).fetchone()[0]
+
+    def iter_actors(self, after, limit: int):
+        for rows in self._iter_rows(
+            "SELECT id, name FROM actors", after, limit
+        ):
+            yield Batch(
+                rows[-1]["id"], len(rows),
+                persons=self._new_names(
+                    (row["name"] for row in rows), self._seen_persons
+                ),
+            )
 
-        movies = []
-        for row in sqlite_movies:
+    def iter_writers(self, after, limit: int):
+        for rows in self._iter_rows(
+            "SELECT id, name FROM writers", after, limit
+        ):
+            yield Batch(
+                rows[-1]["id"], len(rows),
+                persons=self._new_names(
+                    (row["name"] for row in rows), self._seen_persons
+                ),
+            )
 
-            imdb_rating = 0.0
-            if not self._check_na(row["imdb_rating"]):
-                imdb_rating = float(row["imdb_rating"])
+    def iter_movies(self, after, limit: int, last=None,
+                    linked_persons: bool = False):
+        """Фильмы со связями за один проход по movies и movie_actors;
+        last - последний ключ (None - до конца таблицы).
+
+        Режисёры и жанры берутся из тех же строк фильмов; новые имена
+        отдаются в persons и genres пачки и должны быть записаны раньше
+        её фильмов. linked_persons=True добавляет в persons и актёров
+        со сценаристами пачки - когда фазы актёров и сценаристов
+        не выполняются (перезагрузка диапазона).
+        """
+        actors = self._iter_movie_actors(after, limit, last)
+        next_actor = next(actors, None)
+
+        for rows in self._iter_rows(
+                "SELECT * FROM movies", after, limit, last=last):
+            # сортировка movie_actors совпадает с сортировкой movies,
+            # поэтому актёры пачки - это непрерывный отрезок потока
+            last_key = rows[-1]["id"]
+            movie_actors = {}
+            while next_actor is not None and next_actor[0] <= last_key:
+                movie_actors.setdefault(next_actor[0], []).append(
+                    next_actor[1]
+                )
+                next_actor = next(actors, None)
 
-            description = ''
-            if not self._check_na(row["plot"]):
-                description = row["plot"]
+            writer_ids = {row["id"]: self._writer_ids(row) for row in rows}
+            writers = self._get_writers(
+                {writer for ids in writer_ids.values() for writer in ids}
+            )
 
+            movies = []
             directors = []
-            if not self._check_na(row["director"]):
-                directors = [x.strip() for x in row['director'].split(',')]
-
-            movies.append(
-                Movie(
-                    imdb_identifier=row["id"],
-                    imdb_rating=imdb_rating,
-                    genres=row["genre"].replace(' ', '').split(','),
-                    title=row["title"],
-                    description=description,
-                    directors=directors,
-                    writers=self._get_movie_writers(
-                        row["writer"],
-                        row["writers"]
-                    ),
-                    actors=self._get_movie_actors(row["id"])
+            genres = []
+            for row in rows:
+
+                imdb_rating = 0.0
+                if not self._check_na(row["imdb_rating"]):
+                    imdb_rating = float(row["imdb_rating"])
+
+                description = ''
+                if not self._check_na(row["plot"]):
+                    description = row["plot"]
+
+                movie_directors = []
+                if not self._check_na(row["director"]):
+                    movie_directors = [
+                        x.strip() for x in row['director'].split(',')
+                    ]
+
+                movie_genres = row["genre"].replace(' ', '').split(',')
+
+                movies.append(
+                    Movie(
+                        imdb_identifier=row["id"],
+                        imdb_rating=imdb_rating,
+                        genres=movie_genres,
+                        title=row["title"],
+                        description=description,
+                        directors=movie_directors,
+                        writers=[
+                            writers[writer] for writer in writer_ids[row["id"]]
+                            if writer in writers
+                        ],
+                        actors=movie_actors.get(row["id"], [])
+                    )
                 )
+                directors += movie_directors
+                genres += movie_genres
+
+            persons = directors
+            if linked_persons:
+                persons = directors + [
+                    person.name
+                    for movie in movies
+                    for person in movie.actors + movie.writers
+                ]
+
+            yield Batch(
+                last_key, len(rows),
+                persons=self._new_names(persons, self._seen_persons),
+                genres=self._new_names(genres, self._seen_genres),
+                movies=movies,
             )
 
-        return movies
 
-    def load_persons(self, start: int, limit: int) -> list:
-        persons = []
-        rows = self.sqlite_connection.execute(
-            "SELECT name FROM actors LIMIT %s, %s" % (start, limit)
-        ).fetchall()
-        for row in rows:
-            persons.append(row["name"])
+class EnhancedJSONEncoder(json.JSONEncoder):
+    def default(self, object):
+        if dataclasses.is_dataclass(object):
+            return dataclasses.asdict(object)
+        return super().default(object)
 
-        rows = self.sqlite_connection.execute(
-            "SELECT director FROM movies LIMIT %s, %s" % (start, limit)
-        ).fetchall()
-        for row in rows:
-            if not self._check_na(row["director"]):
-                for x in row['director'].split(','):
-                    persons.append(x.strip())
 
-        rows = self.sqlite_connection.execute(
-            "SELECT name FROM writers LIMIT %s, %s" % (start, limit)
-        ).fetchall()
+def load_loop(sqlite_action, pg_action, limit: int = 500,
+              checkpoint: PhaseCheckpoint = None, reference_action=None):
+    """Последовательная загрузка фазы: для каждой пачки генератора
+    sqlite_action сначала reference_action (справочники), затем
+    pg_action."""
+    checkpoint = checkpoint or PhaseCheckpoint('')
+    if checkpoint.finished:
+        return True
 
-        for row in rows:
-            persons.append(row["name"])
+    for batch in sqlite_action(checkpoint.last_key, limit):
+        seq = checkpoint.read(batch)
+        if reference_action is not None:
+            reference_action(batch)
+        pg_action(batch)
+        checkpoint.done(seq)
 
-        return persons
+    checkpoint.finish()
 
-    def load_genres(self, start: int, limit: int) -> list:
-        genres = {}
+    return True
 
-        rows = self.sqlite_connection.execute(
-            "SELECT genre FROM movies LIMIT %s, %s" % (start, limit)
-        ).fetchall()
-        for row in rows:
-            for genre in row["genre"].replace(' ', '').split(','):
-                genres.setdefault(genre, None)
 
-        return list(genres.keys())
+def load_pipeline(sqlite_action, pg_actions: list, limit: int = 500,
+                  checkpoint: PhaseCheckpoint = None, reference_action=None):
+    """Конвейер: текущий поток читает пачки из SQLite в ограниченную
+    очередь, каждый pg_action (со своим соединением) пишет в своём потоке.
 
+    reference_action выполняется в потоке читателя до того, как пачка
+    попадёт в очередь. Так новые персоны и жанры пачки закоммичены
+    раньше, чем любой писатель возьмёт её или следующие пачки, которые
+    ссылаются на эти имена, но уже не несут их в себе.
+    """
+    checkpoint = checkpoint or PhaseCheckpoint('')
+    if checkpoint.finished:
+        return True
 
-class EnhancedJSONEncoder(json.JSONEncoder):
-    def default(self, object):
-        if dataclasses.is_dataclass(object):
-            return dataclasses.asdict(object)
-        return super().default(object)
+    batches = queue.Queue(maxsize=len(pg_actions) * 2)
+    errors = []
+
+    def writer(pg_action):
+        while True:
+            item = batches.get()
+            if item is None:
+                break
+            # после ошибки очередь только вычитывается, чтобы читатель
+            # не завис на put()
+            if errors:
+                continue
+            seq, batch = item
+            try:
+                pg_action(batch)
+                checkpoint.done(seq)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [
+        threading.Thread(target=writer, args=(pg_action,))
+        for pg_action in pg_actions
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        for batch in sqlite_action(checkpoint.last_key, limit):
+            if errors:
+                break
+            seq = checkpoint.read(batch)
+            if reference_action is not None:
+                reference_action(batch)
+            batches.put((seq, batch))
+    finally:
+        for _ in threads:
+            batches.put(None)
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+    checkpoint.finish()
 
+    return True
 
-def load_loop(sqlite_action, pg_action):
-    limit = 500
 
-    start = 0
-    while 1:
-        data = sqlite_action(start, limit)
-        if len(data) == 0:
-            break
+SAVERS = {
+    'insert': PostgresSaver,
+    'copy': PostgresCopySaver,
+}
+
+# Фазы загрузки: (имя, генератор SQLiteLoader, таблица SQLite, по которой
+# идёт keyset-итерация, запись справочников в потоке читателя, запись
+# пачки). Актёры и Сценаристы независимы; Фильмы вместе с Режисёрами,
+# Жанрами и всеми связями грузятся последними.
+REFERENCE_PHASES = (
+    ('persons_actors', 'iter_actors', 'actors', None, 'save_references'),
+    ('persons_writers', 'iter_writers', 'writers', None, 'save_references'),
+)
+MOVIES_PHASE = (
+    'movies', 'iter_movies', 'movies', 'save_references', 'save_movies'
+)
+
+
+def _phase_checkpoint(
+        phase: str, table: str, sqlite_loader: SQLiteLoader,
+        checkpoints: CheckpointStore = None, resume: bool = False,
+        progress_interval: float = None) -> PhaseCheckpoint:
+    checkpoint = PhaseCheckpoint(phase, checkpoints, resume=resume)
+    if progress_interval is not None and not checkpoint.finished:
+        checkpoint.progress = Progress(
+            phase, sqlite_loader.count(table), checkpoint.state.rows,
+            progress_interval,
+        )
 
-        pg_action(data)
-        start += limit
+    return checkpoint
 
-    return True
 
+def load_from_sqlite(
+        connection: sqlite3.Connection, pg_conn: _connection,
+        mode: str = 'copy', stats: LoadStats = None,
+        batch_size: int = 500, checkpoints: CheckpointStore = None,
+        resume: bool = False, progress_interval: float = None):
+    """Основной метод загрузки данных из SQLite в Postgres
 
-def load_from_sqlite(connection: sqlite3.Connection, pg_conn: _connection):
-    """Основной метод загрузки данных из SQLite в Postgres"""
-    postgres_saver = PostgresSaver(pg_conn)
+    mode: copy - COPY во временные таблицы и слияние INSERT ... SELECT,
+          insert - execute_batch с INSERT ... ON CONFLICT
+    checkpoints: хранилище чекпоинтов; с resume=True завершённые фазы
+          пропускаются, а остальные продолжаются с сохранённого ключа
+    progress_interval: период вывода хода фаз в секундах (None - без вывода)
+    """
+    stats = stats or LoadStats()
+    postgres_saver = SAVERS[mode](pg_conn, stats)
     sqlite_loader = SQLiteLoader(connection)
 
-    # Загрузка справочника Персон (SQLite: Актёры, Сценаристы и Режисёры)
-    load_loop(
-        sqlite_loader.load_persons,
-        postgres_saver.save_persons_data,
-    )
+    for phase, load_name, table, reference_name, save_name in \
+            REFERENCE_PHASES + (MOVIES_PHASE,):
+        load_loop(
+            getattr(sqlite_loader, load_name),
+            getattr(postgres_saver, save_name),
+            batch_size,
+            _phase_checkpoint(
+                phase, table, sqlite_loader, checkpoints, resume,
+                progress_interval,
+            ),
+            reference_name and getattr(postgres_saver, reference_name),
+        )
 
-    # Загрузка справочника Жанров
-    load_loop(
-        sqlite_loader.load_genres,
-        postgres_saver.save_genres_data,
-    )
+    return stats
 
-    # Загрузка каталога Фильмов и всех связей с Жанрами и Персонами
+
+def reload_movie_range(
+        connection: sqlite3.Connection, pg_conn: _connection, after, last,
+        mode: str = 'copy', stats: LoadStats = None, batch_size: int = 500):
+    """Перезагрузка фильмов с ключами в (after, last] - диапазона из
+    отчёта --verify: фильмы диапазона и их связи удаляются из Postgres
+    и загружаются из SQLite заново. Фазы актёров и сценаристов
+    не выполняются: персоны и жанры, на которые ссылаются фильмы
+    диапазона, пишутся вместе с их пачками (ON CONFLICT DO NOTHING).
+    """
+    stats = stats or LoadStats()
+    postgres_saver = SAVERS[mode](pg_conn, stats)
+    sqlite_loader = SQLiteLoader(connection)
+
+    print('Deleted %d movies in (%s, %s]' % (
+        postgres_saver.delete_movie_range(after, last), after, last
+    ))
+
+    _, _, _, reference_name, save_name = MOVIES_PHASE
     load_loop(
-        sqlite_loader.load_movies,
-        postgres_saver.save_movies_data,
+        lambda _, limit: sqlite_loader.iter_movies(
+            after, limit, last, linked_persons=True
+        ),
+        getattr(postgres_saver, save_name),
+        batch_size,
+        reference_action=getattr(postgres_saver, reference_name),
     )
 
+    return stats
+
+
+def load_from_sqlite_parallel(
+        sqlite_path: str, pg_dsn: dict, workers: int = 4,
+        batch_size: int = 500, mode: str = 'copy', stats: LoadStats = None,
+        checkpoints: CheckpointStore = None, resume: bool = False,
+        progress_interval: float = None):
+    """Конвейерная загрузка: на каждую фазу читатель SQLite и workers
+    писателей, у каждого своё соединение с Postgres.
+
+    Актёры и Сценаристы независимы и грузятся одновременно. Фильмы
+    (а вместе с ними связи) начинаются только после того, как они
+    полностью записаны; Режисёры и Жанры пачки фильмов читатель
+    записывает сам до того, как отдать пачку писателям. Поэтому связи
+    всегда ссылаются на существующие строки.
+    """
+    stats = stats or LoadStats()
+
+    def run_phase(phase: str, load_name: str, table: str,
+                  reference_name: str, save_name: str):
+        sqlite_conn = sqlite3.connect(sqlite_path)
+        sqlite_conn.row_factory = sqlite3.Row
+        sqlite_loader = SQLiteLoader(sqlite_conn)
+        checkpoint = _phase_checkpoint(
+            phase, table, sqlite_loader, checkpoints, resume,
+            progress_interval,
+        )
+        if checkpoint.finished:
+            sqlite_conn.close()
+            return
+
+        pg_conns = [
+            psycopg2.connect(**pg_dsn, cursor_factory=DictCursor)
+            for _ in range(workers + bool(reference_name))
+        ]
+        savers = [SAVERS[mode](pg_conn, stats) for pg_conn in pg_conns]
+        reference_action = None
+        if reference_name:
+            reference_action = getattr(savers.pop(), reference_name)
+
+        try:
+            load_pipeline(
+                getattr(sqlite_loader, load_name),
+                [getattr(saver, save_name) for saver in savers],
+                batch_size,
+                checkpoint,
+                reference_action,
+            )
+        finally:
+            for pg_conn in pg_conns:
+                pg_conn.close()
+            sqlite_conn.close()
+
+    with ThreadPoolExecutor(max_workers=len(REFERENCE_PHASES)) as executor:
+        phases = [
+            executor.submit(run_phase, *phase) for phase in REFERENCE_PHASES
+        ]
+        for phase in phases:
+            phase.result()
+
+    run_phase(*MOVIES_PHASE)
+
+    return stats
+
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Loads the movie catalog from SQLite into Postgres'
+    )
+    parser.add_argument(
+        '--sqlite',
+        default='db.sqlite',
+        help='Path to the SQLite database',
+    )
+    parser.add_argument(
+        '--mode',
+        choices=SAVERS.keys(),
+        default='copy',
+        help='copy - COPY into staging tables (default), '
+        'insert - INSERT ... ON CONFLICT batches',
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='The number of concurrent Postgres writers; '
+        'more than 1 enables the pipelined loader',
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=500,
+        help='The number of SQLite rows in one batch',
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='Continue an interrupted load from the saved checkpoints',
+    )
+    parser.add_argument(
+        '--progress-interval',
+        type=float,
+        default=5.0,
+        help='Seconds between progress lines (rows/s and ETA per phase)',
+    )
+    parser.add_argument(
+        '--bulk-session',
+        action='store_true',
+        help='Drop secondary indexes and foreign keys for the load, '
+        'then rebuild and validate them',
+    )
+    parser.add_argument(
+        '--maintenance-work-mem',
+        default='512MB',
+        help='maintenance_work_mem for rebuilding one index '
+        '(with --bulk-session)',
+    )
+    parser.add_argument(
+        '--range',
+        nargs=2,
+        metavar=('AFTER', 'LAST'),
+        help='Reload only the movies with imdb ids in (AFTER, LAST], '
+        'as listed by --verify; None means an open bound',
+    )
+    parser.add_argument(
+        '--verify',
+        action='store_true',
+        help='Do not load; compare Postgres with SQLite by hashed batches '
+        'and report mismatched key ranges',
+    )
+    args = parser.parse_args()
 
     env = environ.Env()
     env.read_env(env.str('ENV_PATH', '.env'))
@@ -409,6 +1244,69 @@ if __name__ == '__main__':
         'options': '-c search_path=content',
     }
 
-    with sqlite3.connect('db.sqlite') as sqlite_conn, psycopg2.connect(**pg_dsn, cursor_factory=DictCursor) as pg_conn:
-        sqlite_conn.row_factory = sqlite3.Row
-        load_from_sqlite(sqlite_conn, pg_conn)
+    if args.verify:
+        from verify_data import verify
+
+        report = verify(args.sqlite, pg_dsn, batch_size=args.batch_size)
+        print(report.report())
+        sys.exit(0 if report.ok else 1)
+
+    if args.range:
+        after, last = (
+            None if key == 'None' else key for key in args.range
+        )
+        with sqlite3.connect(args.sqlite) as sqlite_conn, psycopg2.connect(**pg_dsn, cursor_factory=DictCursor) as pg_conn:
+            sqlite_conn.row_factory = sqlite3.Row
+            stats = reload_movie_range(
+                sqlite_conn, pg_conn, after, last, mode=args.mode,
+                batch_size=args.batch_size,
+            )
+        print(stats.report())
+        sys.exit(0)
+
+    checkpoint_conn = psycopg2.connect(**pg_dsn)
+    checkpoints = CheckpointStore(checkpoint_conn)
+    if not args.resume:
+        checkpoints.reset()
+
+    session = nullcontext()
+    if args.bulk_session:
+        # общий с командой fake_data модуль; Django ему не нужен
+        sys.path.append(os.path.join(
+            os.path.dirname(os.path.abspath(__file__)),
+            os.pardir, 'movies_admin',
+        ))
+        from movies.bulk_session import BulkLoadSession
+
+        session = BulkLoadSession(
+            lambda: psycopg2.connect(**pg_dsn),
+            [
+                'content.persons', 'content.genres', 'content.movies',
+                'content.genre_movie', 'content.movie_person_role',
+            ],
+            workers=max(args.workers, 2),
+            maintenance_work_mem=args.maintenance_work_mem,
+        )
+
+    try:
+        with session:
+            if args.workers > 1:
+                stats = load_from_sqlite_parallel(
+                    args.sqlite, pg_dsn, workers=args.workers,
+                    batch_size=args.batch_size, mode=args.mode,
+                    checkpoints=checkpoints, resume=args.resume,
+                    progress_interval=args.progress_interval,
+                )
+            else:
+                with sqlite3.connect(args.sqlite) as sqlite_conn, psycopg2.connect(**pg_dsn, cursor_factory=DictCursor) as pg_conn:
+                    sqlite_conn.row_factory = sqlite3.Row
+                    stats = load_from_sqlite(
+                        sqlite_conn, pg_conn, mode=args.mode,
+                        batch_size=args.batch_size, checkpoints=checkpoints,
+                        resume=args.resume,
+                        progress_interval=args.progress_interval,
+                    )
+    finally:
+        checkpoint_conn.close()
+
+    print(stats.report())
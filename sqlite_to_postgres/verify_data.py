@@ -0,0 +1,418 @@
+"""Сверка SQLite и Postgres после загрузки.
+
+Обе стороны читаются потоком и хешируются одновременно. Фильмы
+сравниваются диапазонами ключей (imdb id) тех же пачек, что и при
+загрузке. Хеш диапазона - сумма 64-битных хешей строк по модулю 2^64,
+поэтому он не зависит от порядка строк и связей. Хеш фильма включает его
+поля, жанры и персоны по ролям, то есть покрывает и связи. Персоны
+и жанры сравниваются корзинами по хешу имени.
+
+Совпавшие диапазоны больше не читаются. Несовпавшие перечитываются
+построчно, и в отчёт попадают конкретные ключи.
+"""
+import hashlib
+import queue
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from decimal import ROUND_HALF_UP, Decimal
+
+import psycopg2
+
+from load_data import Movie, PostgresSaver, SQLiteLoader
+
+MODULO = 2 ** 64
+
+MOVIES_SQL = (
+    "SELECT m.imdb_identifier, m.title, m.description, m.imdb_rating, "
+    "   ARRAY("
+    "       SELECT g.name FROM content.genre_movie gm "
+    "       JOIN content.genres g ON g.id = gm.genre_id "
+    "       WHERE gm.movie_id = m.id"
+    "   ), "
+    "   ARRAY("
+    "       SELECT pr.name || ':' || p.full_name "
+    "       FROM content.movie_person_role mpr "
+    "       JOIN content.persons p ON p.id = mpr.person_id "
+    "       JOIN content.person_roles pr ON pr.id = mpr.person_role_id "
+    "       WHERE mpr.movie_id = m.id"
+    "   ) "
+    "FROM content.movies m "
+    "WHERE m.imdb_identifier IS NOT NULL {where}"
+    # побайтовый порядок, как у ORDER BY id в SQLite
+    "ORDER BY m.imdb_identifier COLLATE \"C\""
+)
+
+
+def _digest(*values) -> int:
+    data = '\x1f'.join(values).encode()
+    return int.from_bytes(
+        hashlib.blake2b(data, digest_size=8).digest(), 'little'
+    )
+
+
+def _movie_digest(imdb_identifier: str, title: str, description: str,
+                  rating, genres, persons) -> int:
+    return _digest(
+        imdb_identifier,
+        title,
+        description or '',
+        # numeric(3,1) в Postgres округляет половину от нуля
+        str(Decimal(str(rating)).quantize(Decimal('0.1'), ROUND_HALF_UP)),
+        '\x1e'.join(sorted(set(genres))),
+        '\x1e'.join(sorted(set(persons))),
+    )
+
+
+def sqlite_movie_digest(movie: Movie) -> int:
+    """Хеш фильма в том виде, в котором его запишет загрузчик."""
+    return _movie_digest(
+        movie.imdb_identifier,
+        movie.title,
+        movie.description,
+        movie.imdb_rating,
+        movie.genres,
+        (
+            '{}:{}'.format(role, name)
+            for _, name, role in PostgresSaver._movie_persons([movie])
+        ),
+    )
+
+
+def postgres_movie_digest(row) -> int:
+    return _movie_digest(*row)
+
+
+@dataclass
+class RangeHash:
+    """Хеш фильмов с ключами в (after, last]; None - без границы."""
+    after: object
+    last: object
+    rows: int = 0
+    digest: int = 0
+
+    def add(self, digest: int) -> None:
+        self.rows += 1
+        self.digest = (self.digest + digest) % MODULO
+
+
+class BucketHashes():
+    """Количество и хеш имён по корзинам (корзина - по хешу имени)."""
+
+    def __init__(self, buckets: int) -> None:
+        self.rows = [0] * buckets
+        self.digests = [0] * buckets
+
+    def bucket(self, digest: int) -> int:
+        return digest % len(self.rows)
+
+    def add(self, name: str) -> None:
+        digest = _digest(name)
+        i = self.bucket(digest)
+        self.rows[i] += 1
+        self.digests[i] = (self.digests[i] + digest) % MODULO
+
+    def mismatched(self, other: 'BucketHashes') -> set:
+        return {
+            i for i in range(len(self.rows))
+            if self.rows[i] != other.rows[i]
+            or self.digests[i] != other.digests[i]
+        }
+
+
+@dataclass
+class RangeMismatch:
+    after: object
+    last: object
+    sqlite_rows: int
+    postgres_rows: int
+    missing: list = field(default_factory=list)
+    extra: list = field(default_factory=list)
+    different: list = field(default_factory=list)
+
+
+@dataclass
+class VerifyReport:
+    ranges: int = 0
+    movies: list[RangeMismatch] = field(default_factory=list)
+    missing_persons: list = field(default_factory=list)
+    extra_persons: list = field(default_factory=list)
+    missing_genres: list = field(default_factory=list)
+    extra_genres: list = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not (
+            self.movies or self.missing_persons or self.extra_persons
+            or self.missing_genres or self.extra_genres
+        )
+
+    def report(self, limit: int = 20) -> str:
+        def keys(values):
+            values = sorted(values)
+            text = ', '.join(str(v) for v in values[:limit])
+            if len(values) > limit:
+                text += ', ... (%d more)' % (len(values) - limit)
+            return text
+
+        lines = ['%d movie ranges checked, %d mismatched' % (
+            self.ranges, len(self.movies)
+        )]
+        for m in self.movies:
+            lines.append(
+                'movies (%s, %s]: sqlite %d rows, postgres %d rows' % (
+                    m.after, m.last, m.sqlite_rows, m.postgres_rows
+                )
+            )
+            for name in ('missing', 'extra', 'different'):
+                if getattr(m, name):
+                    lines.append('  %-9s %s' % (name, keys(getattr(m, name))))
+
+        for name in ('missing_persons', 'extra_persons', 'missing_genres',
+                     'extra_genres'):
+            if getattr(self, name):
+                lines.append('%s: %s' % (name, keys(getattr(self, name))))
+
+        if self.movies:
+            lines.append(
+                'reload a movie range with: '
+                'load_data.py --range AFTER LAST'
+            )
+        lines.append('OK' if self.ok else 'MISMATCH')
+
+        return '\n'.join(lines)
+
+
+def _sqlite_connection(sqlite_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(sqlite_path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _iter_sqlite_batches(loader: SQLiteLoader, batch_size: int):
+    """Все пачки загрузчика по порядку: персоны и жанры в них уже без
+    повторов, ровно то, что загрузчик записал бы в Postgres."""
+    for iterate in (loader.iter_actors, loader.iter_writers,
+                    loader.iter_movies):
+        for batch in iterate(None, batch_size):
+            yield batch
+
+
+def hash_sqlite(sqlite_path: str, batch_size: int, buckets: int,
+                boundaries: queue.Queue):
+    """Хеши стороны SQLite. Границы диапазонов фильмов по мере чтения
+    отдаются в boundaries, чтобы сторона Postgres делила свой поток
+    теми же ключами, не дожидаясь конца."""
+    conn = _sqlite_connection(sqlite_path)
+    ranges = []
+    persons = BucketHashes(buckets)
+    genres = set()
+    try:
+        after = None
+        for batch in _iter_sqlite_batches(SQLiteLoader(conn), batch_size):
+            for name in batch.persons:
+                persons.add(name)
+            genres.update(batch.genres)
+            if not batch.movies:
+                continue
+
+            movies = RangeHash(after, batch.last_key)
+            for movie in batch.movies:
+                movies.add(sqlite_movie_digest(movie))
+            ranges.append(movies)
+            boundaries.put(batch.last_key)
+            after = batch.last_key
+
+        # всё, что в Postgres после последнего ключа SQLite, - лишнее
+        ranges.append(RangeHash(after, None))
+    finally:
+        boundaries.put(None)
+        conn.close()
+
+    return ranges, persons, genres
+
+
+def hash_postgres_movies(pg_dsn: dict, batch_size: int,
+                         boundaries: queue.Queue) -> list:
+    conn = psycopg2.connect(**pg_dsn)
+    ranges = []
+    try:
+        cur = conn.cursor(name='verify_movies')
+        cur.itersize = batch_size * 4
+        cur.execute(MOVIES_SQL.format(where=''))
+
+        after, last = None, boundaries.get()
+        current = RangeHash(after, last)
+        for row in cur:
+            while last is not None and row[0] > last:
+                ranges.append(current)
+                after, last = last, boundaries.get()
+                current = RangeHash(after, last)
+            current.add(postgres_movie_digest(row))
+
+        # диапазоны после последней строки Postgres пусты
+        while last is not None:
+            ranges.append(current)
+            after, last = last, boundaries.get()
+            current = RangeHash(after, last)
+        ranges.append(current)
+
+        cur.close()
+    finally:
+        conn.close()
+
+    return ranges
+
+
+def _iter_postgres_names(conn, sql: str, batch_size: int):
+    cur = conn.cursor(name='verify_names')
+    cur.itersize = batch_size * 4
+    cur.execute(sql)
+    for row in cur:
+        yield row[0]
+    cur.close()
+    conn.commit()
+
+
+def hash_postgres_names(pg_dsn: dict, batch_size: int, buckets: int):
+    conn = psycopg2.connect(**pg_dsn)
+    persons = BucketHashes(buckets)
+    try:
+        for name in _iter_postgres_names(
+            conn, "SELECT full_name FROM content.persons", batch_size
+        ):
+            persons.add(name)
+        genres = set(_iter_postgres_names(
+            conn, "SELECT name FROM content.genres", batch_size
+        ))
+    finally:
+        conn.close()
+
+    return persons, genres
+
+
+def _range_mismatch(sqlite_path: str, pg_dsn: dict, batch_size: int,
+                    sqlite_range: RangeHash,
+                    postgres_range: RangeHash) -> RangeMismatch:
+    """Построчное сравнение одного диапазона фильмов."""
+    after, last = sqlite_range.after, sqlite_range.last
+
+    expected = {}
+    conn = _sqlite_connection(sqlite_path)
+    try:
+        for batch in SQLiteLoader(conn).iter_movies(after, batch_size):
+            for movie in batch.movies:
+                if last is None or movie.imdb_identifier <= last:
+                    expected[movie.imdb_identifier] = \
+                        sqlite_movie_digest(movie)
+            break
+    finally:
+        conn.close()
+
+    where, params = '', []
+    if after is not None:
+        where += "AND m.imdb_identifier COLLATE \"C\" > %s "
+        params.append(after)
+    if last is not None:
+        where += "AND m.imdb_identifier COLLATE \"C\" <= %s "
+        params.append(last)
+
+    actual = {}
+    conn = psycopg2.connect(**pg_dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(MOVIES_SQL.format(where=where), params)
+            for row in cur:
+                # повтор ключа в Postgres - тоже расхождение
+                actual[row[0]] = None if row[0] in actual \
+                    else postgres_movie_digest(row)
+    finally:
+        conn.close()
+
+    return RangeMismatch(
+        after, last, sqlite_range.rows, postgres_range.rows,
+        missing=sorted(expected.keys() - actual.keys()),
+        extra=sorted(actual.keys() - expected.keys()),
+        different=sorted(
+            key for key in expected.keys() & actual.keys()
+            if expected[key] != actual[key]
+        ),
+    )
+
+
+def _bucket_names(sqlite_path: str, pg_dsn: dict, batch_size: int,
+                  persons: BucketHashes, buckets: set):
+    """Имена персон из несовпавших корзин с обеих сторон."""
+    expected = set()
+    conn = _sqlite_connection(sqlite_path)
+    try:
+        for batch in _iter_sqlite_batches(SQLiteLoader(conn), batch_size):
+            expected.update(
+                name for name in batch.persons
+                if persons.bucket(_digest(name)) in buckets
+            )
+    finally:
+        conn.close()
+
+    conn = psycopg2.connect(**pg_dsn)
+    try:
+        actual = {
+            name for name in _iter_postgres_names(
+                conn, "SELECT full_name FROM content.persons", batch_size
+            )
+            if persons.bucket(_digest(name)) in buckets
+        }
+    finally:
+        conn.close()
+
+    return expected, actual
+
+
+def verify(sqlite_path: str, pg_dsn: dict, batch_size: int = 500,
+           buckets: int = 256) -> VerifyReport:
+    """Сверяет загруженные в Postgres данные с исходной SQLite."""
+    boundaries = queue.Queue()
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        sqlite_hashes = executor.submit(
+            hash_sqlite, sqlite_path, batch_size, buckets, boundaries
+        )
+        postgres_movies = executor.submit(
+            hash_postgres_movies, pg_dsn, batch_size, boundaries
+        )
+        postgres_names = executor.submit(
+            hash_postgres_names, pg_dsn, batch_size, buckets
+        )
+
+        sqlite_ranges, sqlite_persons, sqlite_genres = sqlite_hashes.result()
+        postgres_ranges = postgres_movies.result()
+        postgres_persons, postgres_genres = postgres_names.result()
+
+    report = VerifyReport(ranges=len(sqlite_ranges))
+    report.missing_genres = sorted(sqlite_genres - postgres_genres)
+    report.extra_genres = sorted(postgres_genres - sqlite_genres)
+
+    mismatched = [
+        (expected, actual)
+        for expected, actual in zip(sqlite_ranges, postgres_ranges)
+        if (expected.rows, expected.digest) != (actual.rows, actual.digest)
+    ]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        report.movies = list(executor.map(
+            lambda ranges: _range_mismatch(
+                sqlite_path, pg_dsn, batch_size, *ranges
+            ),
+            mismatched,
+        ))
+
+    buckets = sqlite_persons.mismatched(postgres_persons)
+    if buckets:
+        expected, actual = _bucket_names(
+            sqlite_path, pg_dsn, batch_size, sqlite_persons, buckets
+        )
+        report.missing_persons = sorted(expected - actual)
+        report.extra_persons = sorted(actual - expected)
+        if not (report.missing_persons or report.extra_persons):
+            # те же имена, но в Postgres есть повторы
+            report.extra_persons = sorted(actual)
+
+    return report